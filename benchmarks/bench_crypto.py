@@ -0,0 +1,70 @@
+# python benchmarks/bench_crypto.py [rows]
+# per row cost of encrypting and decrypting the two secret fields of an entry. 'secret buffer' goes through
+# the zeroizing SecretCipher, the other ones through cryptography's Fernet
+import sys
+import timeit
+
+from cryptography.fernet import Fernet
+from minipassword.box import PasswordManager
+from minipassword.secret import SecretBuffer
+
+
+class KeyOnlyConf:
+
+    def __init__(self, aes_key):
+        self.aes_key = aes_key
+
+    def get(self, section, key, fallback=None):
+        if key == 'aes_key':
+            return self.aes_key
+        if key in ('retired_keys', 'login_index_key'):
+            return fallback
+        return ':memory:'
+
+
+def legacy_encrypt(aes_key, data):
+    f = Fernet(aes_key.encode())
+    return f.encrypt(data.encode()).decode()
+
+
+def legacy_decrypt(aes_key, encrypt_data):
+    f = Fernet(aes_key.encode())
+    return f.decrypt(encrypt_data.encode()).decode()
+
+
+def report(label, seconds, rows):
+    print(f'{label:<28} {seconds / rows * 1e6:8.2f} us/row')
+
+
+def main(rows=10000):
+    aes_key = Fernet.generate_key().decode()
+    pm = PasswordManager(conf_utils=KeyOnlyConf(aes_key))
+    login_name, password = 'account@example.com', 'correct horse battery staple'
+    token_login, token_password = pm.aes_encrypt(login_name), pm.aes_encrypt(password)
+    bytes_login, bytes_password = token_login.encode(), token_password.encode()
+    secret_login, secret_password = SecretBuffer.from_str(login_name), SecretBuffer.from_str(password)
+
+    def decrypt_secrets():
+        pm.decrypt_secret(token_login).wipe()
+        pm.decrypt_secret(token_password).wipe()
+
+    cases = [
+        ('encrypt, Fernet per call', lambda: (legacy_encrypt(aes_key, login_name),
+                                              legacy_encrypt(aes_key, password))),
+        ('encrypt, cached cipher', lambda: (pm.aes_encrypt(login_name), pm.aes_encrypt(password))),
+        ('encrypt, secret buffer', lambda: (pm.aes_encrypt(secret_login), pm.aes_encrypt(secret_password))),
+        ('encrypt, cached bytes', lambda: (pm.aes_encrypt_bytes(b'account@example.com'),
+                                           pm.aes_encrypt_bytes(b'correct horse battery staple'))),
+        ('decrypt, Fernet per call', lambda: (legacy_decrypt(aes_key, token_login),
+                                              legacy_decrypt(aes_key, token_password))),
+        ('decrypt, cached cipher', lambda: (pm.aes_decrypt(token_login), pm.aes_decrypt(token_password))),
+        ('decrypt, secret buffer', decrypt_secrets),
+        ('decrypt, cached bytes', lambda: (pm.aes_decrypt_bytes(bytes_login),
+                                           pm.aes_decrypt_bytes(bytes_password))),
+    ]
+    for label, func in cases:
+        report(label, min(timeit.repeat(func, number=rows, repeat=3)), rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,32 @@
+# python benchmarks/bench_import.py [runs]
+# start up cost of the mm command, from python -X importtime
+import statistics
+import subprocess
+import sys
+
+
+def import_times(statement):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(runs=10):
+    samples = [import_times('import minipassword.commands') for _ in range(runs)]
+    total = statistics.median(sample['minipassword.commands'] for sample in samples)
+    print(f'minipassword.commands: {total / 1000:.1f} ms (median of {runs} runs)')
+
+    top_level = {name for name in samples[0] if '.' not in name}
+    medians = {name: statistics.median(sample.get(name, 0) for sample in samples) for name in top_level}
+    for name, cumulative in sorted(medians.items(), key=lambda item: -item[1])[:10]:
+        print(f'  {name:<24} {cumulative / 1000:6.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,42 @@
+# python benchmarks/bench_search.py [entries]
+# per keystroke latency of the search as you type index
+import random
+import sys
+import time
+
+from minipassword.search import FuzzyIndex
+
+WORDS = ['google', 'mail', 'bank', 'github', 'aws', 'prod', 'staging', 'router', 'wifi', 'netflix', 'amazon',
+         'paypal', 'vpn', 'ssh', 'db', 'admin', 'server', 'home', 'office', 'test']
+
+
+def synthetic_rows(count):
+    rng = random.Random(1)
+    for i in range(count):
+        name = f'{" ".join(rng.sample(WORDS, 2))}-{i}'
+        url = f'https://{rng.choice(WORDS)}.example.com/{rng.choice(WORDS)}'
+        yield i, name, url, rng.choice(['', 'personal account', 'shared with team'])
+
+
+def main(count=100000):
+    start = time.perf_counter()
+    index = FuzzyIndex(synthetic_rows(count))
+    print(f'load {count} entries: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    # names, words that are in no entry, and short queries held by most entries
+    queries = ('google', 'netfl', 'zzq', 'pxq', 'admin', 'stag', 'pe', 'mp', 'pl', 'ea', 'x/', '.3', '7', 'e')
+    worst = 0
+    for word in queries:
+        query = ''
+        for char in word:
+            query += char
+            start = time.perf_counter()
+            index.search(query)
+            elapsed = (time.perf_counter() - start) * 1000
+            worst = max(worst, elapsed)
+            print(f'{query:<10} {elapsed:6.2f} ms')
+    print(f'worst keystroke: {worst:.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,210 @@
+# python benchmarks/bench_vault.py [--sizes 1000,100000,1000000] [--output results.json] [--compare old.json]
+# times the hot paths of PasswordManager against synthetic vaults in a temporary directory,
+# cloud transfers go to the stand-in server of the tests
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+from minipassword.box import ConfUtils, PasswordManager
+from tests.cloudserver import CloudServer
+
+WORDS = ['google', 'mail', 'bank', 'github', 'aws', 'prod', 'staging', 'router', 'wifi', 'netflix', 'amazon',
+         'paypal', 'vpn', 'ssh', 'db', 'admin', 'server', 'home', 'office', 'test']
+QUERIES = ('github', 'staging', 'zzq')
+# distinct encrypted values in a synthetic vault, every row is still a real Fernet token
+TOKEN_POOL = 1000
+
+
+class SyntheticVault:
+
+    def __init__(self, size, seed=1):
+        self.size = size
+        self.directory = tempfile.TemporaryDirectory()
+        self.conf_utils = ConfUtils(data_path=self.directory.name)
+        self.conf_utils.create_database_file()
+        self.conf_utils.set('common', 'aes_key', Fernet.generate_key().decode())
+        self.conf_utils.set('common', 'cloud_api', 'http://127.0.0.1:1/api')
+        self.conf_utils.set('common', 'cloud_token', 'token')
+        self.password_manager = PasswordManager(conf_utils=self.conf_utils)
+        self._fill(seed)
+
+    def _fill(self, seed):
+        # bypasses add_passwords, encrypting a million rows would dominate the run
+        rng = random.Random(seed)
+        pm = self.password_manager
+        tokens = [(pm.aes_encrypt(f'user{i}@example.com'), pm.aes_encrypt(f'secret-{i}')) for i in range(TOKEN_POOL)]
+
+        def rows():
+            for i in range(self.size):
+                login_name, password = tokens[i % TOKEN_POOL]
+                name = f'{" ".join(rng.sample(WORDS, 2))} {i}'
+                url = f'https://{rng.choice(WORDS)}.example.com/{rng.choice(WORDS)}'
+                yield name, login_name, password, rng.choice(['', 'personal account', 'shared with team']), url, None
+
+        with pm._lock, pm.connect() as conn:
+            conn.executemany(pm.INSERT_SQL, rows())
+
+    def cleanup(self):
+        self.password_manager.close()
+        self.directory.cleanup()
+
+
+def measure(func, repeat, setup=None):
+    # seconds of every run, setup is not timed
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summary(times, ops):
+    return {
+        'ops': ops,
+        'runs': len(times),
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'per_op_us': min(times) / ops * 1e6,
+    }
+
+
+def run_size(size, repeat, server):
+    vault = SyntheticVault(size)
+    pm = vault.password_manager
+    results = {}
+
+    def record(name, times, ops=1):
+        results[name] = summary(times, ops)
+        print(f'  {name:<24} {results[name]["min_s"] * 1000:10.2f} ms {results[name]["per_op_us"]:12.2f} us/op',
+              flush=True)
+
+    try:
+        counter = iter(range(10 ** 9))
+
+        singles = 200
+        record('add_password', measure(
+            lambda: [pm.add_password(f'single {next(counter)}', 'user', 'secret') for _ in range(singles)], repeat,
+        ), singles)
+
+        bulk = min(size, 10000)
+        record('add_passwords', measure(lambda: pm.add_passwords(
+            (f'bulk {next(counter)}', 'user', 'secret') for _ in range(bulk)
+        ), repeat), bulk)
+
+        record('get_password', measure(lambda: [pm.get_password(query) for query in QUERIES], repeat), len(QUERIES))
+        record('like_search', measure(
+            lambda: [list(pm.iter_passwords(query)) for query in QUERIES], repeat,
+        ), len(QUERIES))
+        record('get_password_by_name', measure(
+            lambda: [pm.get_password_by_name(f'single {i}') for i in range(singles)], repeat,
+        ), singles)
+
+        total = len(pm.get_all_passwords())
+        record('get_all_passwords', measure(pm.get_all_passwords, repeat), total)
+
+        def decrypt_all():
+            for entry in pm.iter_passwords():
+                entry.login_name
+                entry.password
+        record('decrypt_all', measure(decrypt_all, 1 if size >= 1000000 else repeat), total)
+
+        backups = []
+        record('backup_db', measure(lambda: backups.append(pm.backup_db()), repeat), 1)
+        for backup_file in backups:
+            os.remove(backup_file)
+
+        vault.conf_utils.set('common', 'cloud_api', server.url)
+        # opens the pooled connection, the first request would otherwise pay for it
+        pm.upload_db()
+        record('upload_db', measure(pm.upload_db, repeat), 1)
+        record('upload_db_chunked', measure(lambda: pm.upload_db(chunked=True), repeat), 1)
+        record('restore_db', measure(pm.restore_db, repeat), 1)
+        for backup_file in os.listdir(vault.directory.name):
+            if '_bak_' in backup_file:
+                os.remove(os.path.join(vault.directory.name, backup_file))
+
+        # one full sync, then the cost of sending a handful of changes
+        pm.upload_db(delta=True)
+
+        def change():
+            for i in range(10):
+                pm.add_password(f'delta {next(counter)}', 'user', 'secret')
+        record('upload_db_delta', measure(lambda: pm.upload_db(delta=True), repeat, setup=change), 1)
+        results['database_bytes'] = os.path.getsize(pm.database_file)
+    finally:
+        vault.cleanup()
+
+    return results
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    print(f'\ncompared with {baseline_file} ({baseline["environment"].get("git_revision")}):')
+    for size, benchmarks in results['sizes'].items():
+        for name, result in benchmarks.items():
+            old = baseline['sizes'].get(size, {}).get(name)
+            if not isinstance(result, dict) or not old:
+                continue
+            ratio = result['per_op_us'] / old['per_op_us']
+            flag = '  slower' if ratio > 1.1 else ''
+            print(f'  {size:>8} {name:<24} {ratio:6.2f}x{flag}')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vault hot paths.')
+    parser.add_argument('--sizes', default='1000,100000', help='comma separated vault sizes, e.g. 1000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark, the fastest one counts')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='JSON', help='print the ratio to the results of an earlier run')
+    args = parser.parse_args()
+
+    results = {
+        'environment': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'sizes': {},
+    }
+
+    with CloudServer() as server:
+        for size in (int(size) for size in args.sizes.split(',')):
+            print(f'{size} entries:', flush=True)
+            results['sizes'][str(size)] = run_size(size, args.repeat, server)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results written to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,5 +29,9 @@ setuptools.setup(
         'cryptography>=42.0.7',
         'requests>=2.31.0',
     ],
+    extras_require={
+        'async': ['aiohttp>=3.8'],
+        'zstd': ['zstandard>=0.18'],
+    },
     python_requires=">=3.6",
 )
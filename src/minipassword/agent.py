@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import SecretCache
+from .script import FIELDS, AgentClient, ScriptError, ScriptHandler, agent_socket_path
+
+IDLE_TIMEOUT = 15 * 60
+
+
+class AgentRunningError(RuntimeError):
+    pass
+
+
+class Agent:
+    # keeps one PasswordManager open and serves the requests of mm COMMAND over a unix socket.
+    # decrypted entries stay in the cache of the manager until nothing was asked for idle_timeout seconds
+
+    def __init__(self, password_manager, socket_path=None, idle_timeout=IDLE_TIMEOUT):
+        if password_manager.cache is None:
+            password_manager.cache = SecretCache()
+        self.password_manager = password_manager
+        self.socket_path = socket_path or agent_socket_path()
+        self.idle_timeout = idle_timeout
+        self.ready = threading.Event()
+        self.script = ScriptHandler(password_manager, None)
+
+        # name -> id of every entry, only touched from the executor thread which is also the only user of the database
+        self.names = {}
+        self._data_version = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._loop = None
+        self._stopped = None
+        self._clients = set()
+        self._last_request = 0
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, self.stop)
+        try:
+            loop.run_until_complete(self.serve())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    async def serve(self):
+        self._loop = asyncio.get_event_loop()
+        self._stopped = asyncio.Event()
+        self._remove_stale_socket()
+        await self._call(self._check_changes)
+
+        # the socket is only accessible by the owner of the vault
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        finally:
+            os.umask(umask)
+
+        self._last_request = self._loop.time()
+        watcher = self._loop.create_task(self._wipe_when_idle())
+        self.ready.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            watcher.cancel()
+            server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await server.wait_closed()
+            await self._call(self.wipe)
+            self._executor.shutdown()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.ready.clear()
+
+    def stop(self):
+        # safe to call from any thread
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def wipe(self):
+        self.password_manager.cache.clear()
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        client = AgentClient.connect(self.socket_path)
+        if client is not None:
+            client.close()
+            raise AgentRunningError(f'an agent is already listening on {self.socket_path}')
+        os.remove(self.socket_path)
+
+    async def _call(self, func, *args):
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _handle(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                self._last_request = self._loop.time()
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ScriptError('a request is a JSON object')
+                    result = await self._call(self.execute, request)
+                except ValueError as e:
+                    result = {'ok': False, 'error': f'invalid request: {e}'}
+                except ScriptError as e:
+                    result = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(result, ensure_ascii=False).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _wipe_when_idle(self):
+        while True:
+            idle = self._loop.time() - self._last_request
+            if idle >= self.idle_timeout:
+                await self._call(self.wipe)
+                idle = 0
+            await asyncio.sleep(self.idle_timeout - idle)
+
+    def execute(self, request):
+        # runs in the executor thread
+        self._check_changes()
+        operation = request.get('op')
+        if operation == 'stats':
+            return {'ok': True, 'entries': len(self.names), 'cache': self.password_manager.cache.stats()}
+
+        name = request.get('name')
+        if not isinstance(name, str) or not name:
+            raise ScriptError('name is required')
+
+        if operation == 'get':
+            return self._get(name, request.get('field'))
+
+        try:
+            return self.script.execute(request)
+        finally:
+            self._refresh(name, request.get('new_name'))
+
+    def _get(self, name, field):
+        # unknown names are answered from the index without a query
+        password = self.password_manager.get_password_by_name(name) if name in self.names else None
+        if password is None:
+            raise ScriptError(f'no entry named {name}')
+        return ScriptHandler.get_result({field: getattr(password, field) for field in FIELDS}, field)
+
+    def _refresh(self, *names):
+        pm = self.password_manager
+        with pm._lock:
+            conn = pm.connect()
+            for name in names:
+                if not isinstance(name, str):
+                    continue
+                row = conn.execute('SELECT id FROM passwords WHERE name=?', (name,)).fetchone()
+                if row is None:
+                    self.names.pop(name, None)
+                else:
+                    self.names[name] = row[0]
+
+    def _check_changes(self):
+        # data_version only moves when another connection commits, e.g. an interactive mm or a restore
+        pm = self.password_manager
+        pm.reload_keys()
+        with pm._lock:
+            conn = pm.connect()
+            version = (conn, conn.execute('PRAGMA data_version').fetchone()[0])
+            if version != self._data_version:
+                self.names = dict(conn.execute('SELECT name, id FROM passwords'))
+                self._data_version = version
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from .box import RESTORE_READ_SIZE, ImportResult, PasswordManager
+
+try:
+    import aiohttp
+except ImportError:
+    # cloud transfers run the requests based code of PasswordManager on a thread instead
+    aiohttp = None
+
+
+def _decrypt_entries(entries):
+    for entry in entries:
+        entry.login_name
+        entry.password
+
+
+class HTTPResponse:
+    # the parts of requests.Response that the callers of upload_db and restore_db use
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.backup_file = None
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncPasswordManager:
+    # the PasswordManager API for asyncio code. database work runs on one thread that owns the connection,
+    # encryption and decryption on a pool of threads and whole file transfers on aiohttp when it is installed.
+    # get_password_by_id and get_password_by_name return decrypted entries, the entries of the other queries
+    # are decrypted on first access like the ones of PasswordManager, await decrypt(*entries) to do it off the loop
+
+    def __init__(self, conf_utils=None, password_manager=None, crypto_workers=None, cache=None):
+        if password_manager is None:
+            password_manager = PasswordManager(conf_utils=conf_utils, cache=cache)
+        self.password_manager = password_manager
+        self._db_executor = ThreadPoolExecutor(max_workers=1)
+        self._crypto_executor = ThreadPoolExecutor(max_workers=crypto_workers or min(os.cpu_count() or 1, 4))
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        await self._db(self.password_manager.close)
+        self._db_executor.shutdown()
+        self._crypto_executor.shutdown()
+
+    async def _db(self, func, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(self._db_executor, partial(func, *args, **kwargs))
+
+    async def _crypto(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._crypto_executor, partial(func, *args))
+
+    async def _io(self, func, *args, **kwargs):
+        return await asyncio.get_event_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def decrypt(self, *entries):
+        await self._crypto(_decrypt_entries, [entry for entry in entries if entry is not None])
+
+    async def add_password(self, name, login_name, password, memo=None, url=None):
+        pm = self.password_manager
+        login_name, password, login_index = await self._crypto(pm._encrypt_secrets, login_name, password)
+        await self._db(pm._insert_password, (name, login_name, password, memo, url, login_index))
+
+    async def add_passwords(self, records, batch_size=500, on_batch=None):
+        pm = self.password_manager
+        result = ImportResult()
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            rows = await self._crypto(pm._encrypt_batch, batch, result)
+            await self._db(pm._insert_batch, rows, result)
+            result.processed += len(batch)
+            if on_batch is not None:
+                on_batch(result)
+
+        return result
+
+    async def get_password(self, query_string):
+        return await self._db(self.password_manager.get_password, query_string)
+
+    async def iter_passwords(self, query=None, batch_size=500):
+        # every page is one query on the database thread
+        rows = self.password_manager.iter_passwords(query, batch_size)
+        while True:
+            page = await self._db(list, islice(rows, batch_size))
+            for row in page:
+                yield row
+            if len(page) < batch_size:
+                return
+
+    async def get_all_passwords(self):
+        return await self._db(self.password_manager.get_all_passwords)
+
+    async def get_password_by_id(self, password_id):
+        entry = await self._db(self.password_manager.get_password_by_id, password_id)
+        await self.decrypt(entry)
+        return entry
+
+    async def get_password_by_name(self, name):
+        entry = await self._db(self.password_manager.get_password_by_name, name)
+        await self.decrypt(entry)
+        return entry
+
+    async def update_password(self, password_id, name, login_name, password, memo=None, url=None):
+        pm = self.password_manager
+        login_name, password, login_index = await self._crypto(pm._encrypt_secrets, login_name, password)
+        await self._db(pm._update_password, password_id, (name, login_name, password, memo, url, login_index))
+
+    async def get_passwords_by_login(self, login_name):
+        return await self._db(self.password_manager.get_passwords_by_login, login_name)
+
+    async def backfill_login_index(self, batch_size=1000, progress=None):
+        # progress is called on the database thread
+        return await self._db(self.password_manager.backfill_login_index, batch_size, progress)
+
+    async def delete_password(self, password_id):
+        await self._db(self.password_manager.delete_password, password_id)
+
+    async def rotate_key(self, new_key=None, chunk_size=1000, processes=None, progress=None):
+        # progress is called on the database thread
+        return await self._db(self.password_manager.rotate_key, new_key, chunk_size, processes, progress)
+
+    async def backup_db(self, backup_file=None, incremental=False, progress=None):
+        return await self._db(self.password_manager.backup_db, backup_file, incremental, progress)
+
+    async def prune_backups(self, keep_full=3):
+        await self._db(self.password_manager.prune_backups, keep_full)
+
+    async def verify_database(self, database_file):
+        await self._db(self.password_manager.verify_database, database_file)
+
+    async def destroy_db(self):
+        await self._db(self.password_manager.destroy_db)
+
+    async def aes_encrypt(self, data):
+        return await self._crypto(self.password_manager.aes_encrypt, data)
+
+    async def aes_decrypt(self, encrypt_data):
+        return await self._crypto(self.password_manager.aes_decrypt, encrypt_data)
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=4))
+        return self._session
+
+    def _cloud_api(self):
+        conf_utils = self.password_manager.conf_utils
+        return conf_utils.get('common', 'cloud_api'), conf_utils.get('common', 'cloud_token')
+
+    async def upload_db(self, chunked=False, chunk_size=None, progress=None, delta=False):
+        pm = self.password_manager
+        if aiohttp is None or chunked or delta:
+            return await self._io(pm.upload_db, chunked=chunked, chunk_size=chunk_size, progress=progress, delta=delta)
+
+        url, token = self._cloud_api()
+        await self._db(pm._checkpoint)
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Authorization': f'Bearer {token}'
+        }
+        with open(pm.database_file, 'rb') as file:
+            async with self.session.post(url, headers=headers, data=file) as response:
+                return HTTPResponse(response.status, await response.read())
+
+    async def restore_db(self, delta=False):
+        pm = self.password_manager
+        if aiohttp is None or delta:
+            return await self._io(pm.restore_db, delta=delta)
+
+        url, token = self._cloud_api()
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+        tmp_file = f'{pm.database_file}.restore'
+        async with self.session.post(url, headers=headers) as response:
+            if response.status != 200:
+                return HTTPResponse(response.status, await response.read())
+            # the file is opened, written and closed in the executor, a slow disk does not stall the event loop
+            try:
+                file = await self._io(open, tmp_file, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(RESTORE_READ_SIZE):
+                        await self._io(file.write, chunk)
+                finally:
+                    await self._io(file.close)
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+
+        result = HTTPResponse(200, b'')
+        result.backup_file = await self._db(pm._install_database, tmp_file)
+        return result
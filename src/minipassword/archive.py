@@ -0,0 +1,303 @@
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    # archives are written with zlib then, reading a zstd archive needs zstandard
+    zstandard = None
+
+# header, blocks of length prefixed records, the index block and the footer:
+#   header  magic, format version
+#   block   codec, crc32 of the payload, payload length, raw length, compressed payload
+#   record  length, id, then name, login_name, password, memo and url as length and utf-8 bytes
+#   index   block count, (offset of every block), then id, block, offset in the block and name of every record
+#   footer  offset of the index block, record count, magic
+# login_name and password are the Fernet tokens of the vault, an archive is read with the key of its vault
+ARCHIVE_MAGIC = b'MPARCHIV'
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct('>8sH')
+ARCHIVE_BLOCK = struct.Struct('>BIII')
+ARCHIVE_FOOTER = struct.Struct('>QQ8s')
+RECORD_LENGTH = struct.Struct('>I')
+RECORD_ID = struct.Struct('>q')
+FIELD_LENGTH = struct.Struct('>I')
+INDEX_COUNT = struct.Struct('>I')
+INDEX_BLOCK = struct.Struct('>Q')
+INDEX_ENTRY = struct.Struct('>qII')
+NULL_FIELD = 0xFFFFFFFF
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+BLOCK_SIZE = 256 * 1024
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def default_compression():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def _compressor(codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError('zstd compression needs the zstandard package')
+        return zstandard.ZstdCompressor(level=3).compress
+    if codec == CODEC_ZLIB:
+        return lambda data: zlib.compress(data, 6)
+    return bytes
+
+
+def _decompress(codec, payload, raw_length):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError('the archive is zstd compressed, install the zstandard package to read it')
+        return zstandard.ZstdDecompressor().decompress(payload, max_output_size=raw_length)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_NONE:
+        return bytes(payload)
+    raise ArchiveError(f'unknown block compression {codec}')
+
+
+def encode_record(row):
+    # row is (id, name, login_name, password, memo, url)
+    parts = [RECORD_ID.pack(row[0])]
+    for value in row[1:]:
+        if value is None:
+            parts.append(FIELD_LENGTH.pack(NULL_FIELD))
+        else:
+            value = value.encode('utf-8')
+            parts.append(FIELD_LENGTH.pack(len(value)))
+            parts.append(value)
+    body = b''.join(parts)
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+def decode_record(data, offset):
+    # the record at offset and the offset of the next one
+    length, = RECORD_LENGTH.unpack_from(data, offset)
+    offset += RECORD_LENGTH.size
+    end = offset + length
+    row = [RECORD_ID.unpack_from(data, offset)[0]]
+    offset += RECORD_ID.size
+    while offset < end:
+        size, = FIELD_LENGTH.unpack_from(data, offset)
+        offset += FIELD_LENGTH.size
+        if size == NULL_FIELD:
+            row.append(None)
+        else:
+            row.append(data[offset:offset + size].decode('utf-8'))
+            offset += size
+    if len(row) != 6 or offset != end:
+        raise ArchiveError('corrupt archive record')
+    return tuple(row), end
+
+
+class ArchiveWriter:
+    # writes records as they come, memory use is one block and the index entries
+
+    def __init__(self, file, compression=None, block_size=BLOCK_SIZE):
+        compression = compression or default_compression()
+        if compression not in CODECS:
+            raise ArchiveError(f'unknown compression {compression}, use one of {", ".join(CODECS)}')
+        self.file = file
+        self.codec = CODECS[compression]
+        self.block_size = block_size
+        self.count = 0
+        self._compress = _compressor(self.codec)
+        self._block = []
+        self._block_length = 0
+        self._block_offsets = []
+        self._index = []
+        self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+
+    def add(self, row):
+        record = encode_record(row)
+        self._index.append((row[0], len(self._block_offsets), self._block_length, row[1]))
+        self._block.append(record)
+        self._block_length += len(record)
+        self.count += 1
+        if self._block_length >= self.block_size:
+            self._flush()
+
+    def _write_block(self, raw):
+        payload = self._compress(raw)
+        self.file.write(ARCHIVE_BLOCK.pack(self.codec, zlib.crc32(payload), len(payload), len(raw)))
+        self.file.write(payload)
+
+    def _flush(self):
+        if not self._block:
+            return
+        self._block_offsets.append(self.file.tell())
+        self._write_block(b''.join(self._block))
+        self._block = []
+        self._block_length = 0
+
+    def close(self):
+        self._flush()
+        index = [INDEX_COUNT.pack(len(self._block_offsets))]
+        index.extend(INDEX_BLOCK.pack(offset) for offset in self._block_offsets)
+        for password_id, block, offset, name in self._index:
+            name = name.encode('utf-8')
+            index.append(INDEX_ENTRY.pack(password_id, block, offset))
+            index.append(FIELD_LENGTH.pack(len(name)))
+            index.append(name)
+        index_offset = self.file.tell()
+        self._write_block(b''.join(index))
+        self.file.write(ARCHIVE_FOOTER.pack(index_offset, self.count, ARCHIVE_MAGIC))
+
+
+class ArchiveReader:
+    # memory maps the archive, a lookup by id or name decompresses the one block holding the record
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        self._file = open(archive_file, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ArchiveError(f'{archive_file} is not a password archive')
+        try:
+            self._read_footer()
+        except BaseException:
+            self.close()
+            raise
+        self._blocks = None
+        self._ids = None
+        self._names = None
+        self._cached_block = (None, None)
+
+    def _read_footer(self):
+        data = self._map
+        if len(data) < ARCHIVE_HEADER.size + ARCHIVE_FOOTER.size:
+            raise ArchiveError(f'{self.archive_file} is not a password archive')
+        magic, version = ARCHIVE_HEADER.unpack_from(data, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ArchiveError(f'{self.archive_file} is not a password archive')
+        if version > ARCHIVE_VERSION:
+            raise ArchiveError(f'archive format {version} is newer than this version of Mini Password')
+        self._index_offset, self.count, magic = ARCHIVE_FOOTER.unpack_from(data, len(data) - ARCHIVE_FOOTER.size)
+        if magic != ARCHIVE_MAGIC:
+            raise ArchiveError(f'{self.archive_file} is truncated')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _read_block(self, offset):
+        codec, crc, length, raw_length = ARCHIVE_BLOCK.unpack_from(self._map, offset)
+        start = offset + ARCHIVE_BLOCK.size
+        payload = memoryview(self._map)[start:start + length]
+        try:
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                raise ArchiveError(f'corrupt archive block at {offset}')
+            raw = _decompress(codec, payload, raw_length)
+        finally:
+            # the map can not be closed while a view of it exists
+            payload.release()
+        if len(raw) != raw_length:
+            raise ArchiveError(f'corrupt archive block at {offset}')
+        return raw
+
+    def _load_index(self):
+        if self._ids is not None:
+            return
+        index = self._read_block(self._index_offset)
+        block_count, = INDEX_COUNT.unpack_from(index, 0)
+        offset = INDEX_COUNT.size
+        self._blocks = [INDEX_BLOCK.unpack_from(index, offset + i * INDEX_BLOCK.size)[0] for i in range(block_count)]
+        offset += block_count * INDEX_BLOCK.size
+        ids, names = {}, {}
+        while offset < len(index):
+            password_id, block, record_offset = INDEX_ENTRY.unpack_from(index, offset)
+            offset += INDEX_ENTRY.size
+            size, = FIELD_LENGTH.unpack_from(index, offset)
+            offset += FIELD_LENGTH.size
+            location = (block, record_offset)
+            ids[password_id] = location
+            names[index[offset:offset + size].decode('utf-8')] = location
+            offset += size
+        self._ids, self._names = ids, names
+
+    def _block(self, number):
+        # the last block read is kept, lookups of neighbouring entries do not decompress it again
+        cached_number, raw = self._cached_block
+        if cached_number != number:
+            raw = self._read_block(self._blocks[number])
+            self._cached_block = (number, raw)
+        return raw
+
+    def _get(self, location):
+        if location is None:
+            return None
+        block, offset = location
+        return decode_record(self._block(block), offset)[0]
+
+    def names(self):
+        self._load_index()
+        return list(self._names)
+
+    def get(self, password_id):
+        self._load_index()
+        return self._get(self._ids.get(password_id))
+
+    def get_by_name(self, name):
+        self._load_index()
+        return self._get(self._names.get(name))
+
+    def __iter__(self):
+        # every record in the order of the ids, one block in memory at a time
+        offset = ARCHIVE_HEADER.size
+        while offset < self._index_offset:
+            length = ARCHIVE_BLOCK.unpack_from(self._map, offset)[2]
+            raw = self._read_block(offset)
+            record_offset = 0
+            while record_offset < len(raw):
+                row, record_offset = decode_record(raw, record_offset)
+                yield row
+            offset += ARCHIVE_BLOCK.size + length
+
+
+def is_archive(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    except OSError:
+        return False
+
+
+def write_archive(rows, archive_file, compression=None, block_size=BLOCK_SIZE):
+    # writes to a temporary file first, an interrupted export leaves no partial archive behind
+    tmp_file = f'{archive_file}.tmp'
+    try:
+        # names, urls and memos are plain text in the archive, it is as private as the vault
+        with os.fdopen(os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            writer = ArchiveWriter(f, compression, block_size)
+            for row in rows:
+                writer.add(row)
+            writer.close()
+        os.replace(tmp_file, archive_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return writer.count
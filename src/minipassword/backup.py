@@ -0,0 +1,167 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+
+DELTA_MAGIC = b'MPDELTA1'
+DELTA_HEADER = struct.Struct('>8sII')
+DELTA_PAGE = struct.Struct('>I')
+
+
+def snapshot(database_file, backup_file, pages=256, progress=None):
+    # copies through the sqlite backup API a few pages at a time, writers are not blocked in between
+    source = sqlite3.connect(database_file)
+    target = sqlite3.connect(backup_file)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+    return backup_file
+
+
+def backup_file_name(database_file, extension=None):
+    name, database_extension = os.path.splitext(database_file)
+    date_str = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    base = f'{name}_bak_{date_str}'
+    extension = database_extension if extension is None else extension
+
+    backup_file = f'{base}{extension}'
+    counter = 1
+    while os.path.exists(backup_file):
+        backup_file = f'{base}_{counter}{extension}'
+        counter += 1
+    return backup_file
+
+
+class IncrementalBackup:
+    # a chain of full snapshots, each followed by deltas that hold only the pages changed since the previous backup
+
+    def __init__(self, database_file, full_every=7, keep_full=3):
+        self.database_file = database_file
+        self.full_every = full_every
+        self.keep_full = keep_full
+        name = os.path.splitext(database_file)[0]
+        self.manifest_file = f'{name}_bak.manifest'
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'page_size': None, 'files': [], 'hashes': []}
+
+    def save_manifest(self, manifest):
+        tmp_file = f'{self.manifest_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_file, self.manifest_file)
+
+    def backup(self, pages=256, progress=None):
+        manifest = self.load_manifest()
+        tmp_file = f'{os.path.splitext(self.database_file)[0]}_bak.tmp'
+        snapshot(self.database_file, tmp_file, pages, progress)
+
+        try:
+            page_size = self._page_size(tmp_file)
+            hashes = self._page_hashes(tmp_file, page_size)
+
+            deltas = 0
+            for entry in reversed(manifest['files']):
+                if entry['type'] == 'full':
+                    break
+                deltas += 1
+            full = (not manifest['files'] or manifest['page_size'] != page_size or deltas + 1 >= self.full_every)
+
+            if full:
+                backup_file = backup_file_name(self.database_file)
+                os.replace(tmp_file, backup_file)
+            else:
+                backup_file = backup_file_name(self.database_file, '.delta')
+                self._write_delta(tmp_file, backup_file, page_size, hashes, manifest['hashes'])
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+        manifest['files'].append({'file': backup_file, 'type': 'full' if full else 'delta'})
+        manifest['page_size'] = page_size
+        manifest['hashes'] = hashes
+        self.prune(manifest)
+        self.save_manifest(manifest)
+
+        return backup_file
+
+    def prune(self, manifest=None):
+        # keeps the last keep_full snapshots and the deltas that build on them
+        save = manifest is None
+        if manifest is None:
+            manifest = self.load_manifest()
+
+        fulls = [i for i, entry in enumerate(manifest['files']) if entry['type'] == 'full']
+        if len(fulls) > self.keep_full:
+            first_kept = fulls[-self.keep_full]
+            for entry in manifest['files'][:first_kept]:
+                if os.path.exists(entry['file']):
+                    os.remove(entry['file'])
+            manifest['files'] = manifest['files'][first_kept:]
+
+        if save:
+            self.save_manifest(manifest)
+
+    def materialize(self, target_file, upto=None):
+        # rebuilds the database as of the backup file upto (default the latest one) into target_file
+        files = self.load_manifest()['files']
+        if upto is not None:
+            files = files[:[entry['file'] for entry in files].index(upto) + 1]
+        start = max(i for i, entry in enumerate(files) if entry['type'] == 'full')
+
+        shutil.copyfile(files[start]['file'], target_file)
+        with open(target_file, 'r+b') as target:
+            for entry in files[start + 1:]:
+                with open(entry['file'], 'rb') as delta:
+                    magic, page_size, page_count = DELTA_HEADER.unpack(delta.read(DELTA_HEADER.size))
+                    if magic != DELTA_MAGIC:
+                        raise ValueError(f'{entry["file"]} is not a delta backup file')
+                    while True:
+                        header = delta.read(DELTA_PAGE.size)
+                        if not header:
+                            break
+                        page_number = DELTA_PAGE.unpack(header)[0]
+                        target.seek(page_number * page_size)
+                        target.write(delta.read(page_size))
+                target.truncate(page_count * page_size)
+
+        return target_file
+
+    @staticmethod
+    def _page_size(database_file):
+        conn = sqlite3.connect(database_file)
+        try:
+            return conn.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _page_hashes(database_file, page_size):
+        hashes = []
+        with open(database_file, 'rb') as f:
+            while True:
+                page = f.read(page_size)
+                if not page:
+                    break
+                hashes.append(hashlib.blake2b(page, digest_size=16).hexdigest())
+        return hashes
+
+    @staticmethod
+    def _write_delta(snapshot_file, delta_file, page_size, hashes, previous_hashes):
+        with open(snapshot_file, 'rb') as source, open(delta_file, 'wb') as delta:
+            delta.write(DELTA_HEADER.pack(DELTA_MAGIC, page_size, len(hashes)))
+            for page_number, page_hash in enumerate(hashes):
+                if page_number < len(previous_hashes) and previous_hashes[page_number] == page_hash:
+                    continue
+                source.seek(page_number * page_size)
+                delta.write(DELTA_PAGE.pack(page_number))
+                delta.write(source.read(page_size))
@@ -1,42 +1,210 @@
 import os
-import requests
+import re
 import glob
-import datetime
 import configparser
 import sqlite3
-import shutil
-from cryptography.fernet import Fernet
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from . import instrument
+from .backup import IncrementalBackup, backup_file_name, snapshot
+from .login_index import LoginIndex, normalize_login
+from .login_index import generate_key as generate_login_index_key
+from .migrations import migrate, name_key
+from .secret import SecretBuffer
+from .sync import UNSUPPORTED_STATUS, DeltaSync
+
+SEARCH_INDEX_SCHEMA = (
+    '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS passwords_fts USING fts5(
+            name, url, memo, content='passwords', content_rowid='id', prefix='2 3'
+        )
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_insert AFTER INSERT ON passwords BEGIN
+            INSERT INTO passwords_fts (rowid, name, url, memo) VALUES (new.id, new.name, new.url, new.memo);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_delete AFTER DELETE ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, name, url, memo)
+            VALUES ('delete', old.id, old.name, old.url, old.memo);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS passwords_fts_update AFTER UPDATE OF name, url, memo ON passwords BEGIN
+            INSERT INTO passwords_fts (passwords_fts, rowid, name, url, memo)
+            VALUES ('delete', old.id, old.name, old.url, old.memo);
+            INSERT INTO passwords_fts (rowid, name, url, memo) VALUES (new.id, new.name, new.url, new.memo);
+        END
+    ''',
+)
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+RESTORE_READ_SIZE = 64 * 1024
+# the vault in the data directory itself, named vaults live in their own data directories
+DEFAULT_VAULT = 'default'
+VAULT_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+
+class InvalidDatabaseError(ValueError):
+    pass
+
+
+def create_search_index(conn):
+    # returns False when the sqlite library is built without FTS5
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='passwords_fts'").fetchone():
+        return True
+
+    try:
+        conn.execute('BEGIN')
+        for sql in SEARCH_INDEX_SCHEMA:
+            conn.execute(sql)
+        # index the rows of databases created before the search index existed
+        conn.execute("INSERT INTO passwords_fts (passwords_fts) VALUES ('rebuild')")
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+        return False
+
+    return True
+
+
+def _rotate_rows(keys, rows):
+    # runs in the worker processes of PasswordManager.rotate_key
+    from cryptography.fernet import Fernet, MultiFernet
+
+    cipher = MultiFernet([Fernet(key.encode()) for key in keys])
+    return [
+        (cipher.rotate(login_name.encode()).decode(), cipher.rotate(password.encode()).decode(), password_id)
+        for password_id, login_name, password in rows
+    ]
+
+
+def _ordered_map(executor, func, iterable, window):
+    # like Executor.map, but never submits more than window items ahead of the consumer
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 class ConfUtils:
     DB_FILENAME = 'minipassword.db'
+    SECTIONS = ('common', 'db')
 
-    def __init__(self):
-        self.data_path = f'{os.path.expanduser("~")}/.minipassword'
+    def __init__(self, data_path=None):
+        # data_path defaults to ~/.minipassword, benchmarks and tests point it to a temporary directory
+        self.data_path = data_path or f'{os.path.expanduser("~")}/.minipassword'
         if not os.path.exists(self.data_path):
             os.makedirs(self.data_path)
         self.config = configparser.ConfigParser()
         self.config_file = f'{self.data_path}/config.ini'
         self.database_file = f'{self.data_path}/{self.DB_FILENAME}'
+        # the parsed file is kept in memory, (inode, mtime, size) of the file tell when another process changed it
+        self._stamp = None
+        self._batch_depth = 0
+        self._dirty = False
 
         if not os.path.exists(self.config_file):
-            with open(self.config_file, 'w') as f:
-                self.config.write(f)
+            self._write()
+        self._load()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.config_file)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self):
+        config = configparser.ConfigParser()
+        with instrument.timer('config.read'):
+            stamp = self._file_stamp()
+            config.read(self.config_file)
+        for section in self.SECTIONS:
+            if not config.has_section(section):
+                config.add_section(section)
+        self.config = config
+        self._stamp = stamp
+        self._dirty = False
 
-            self.config.add_section('common')
-            self.config.add_section('db')
+    def refresh(self):
+        # re-reads the file only when it changed on disk, returns whether it did
+        if self._batch_depth or self._file_stamp() == self._stamp:
+            return False
+        self._load()
+        return True
+
+    def _write(self):
+        # a reader never sees a half written file, and the file holding the key is private to the user
+        tmp_file = f'{self.config_file}.tmp'
+        with instrument.timer('config.write'):
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                self.config.write(f)
+            os.replace(tmp_file, self.config_file)
+        self._stamp = self._file_stamp()
+        self._dirty = False
 
-        self.config.read(self.config_file)
+    @contextmanager
+    def batch(self):
+        # the set calls inside are written at once when the block ends, and dropped if it raises
+        if self._batch_depth == 0:
+            self.refresh()
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self._load()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0 and self._dirty:
+            self._write()
 
-    def get(self, section: str, key: str):
-        return self.config.get(section, key)
+    def get(self, section: str, key: str, **kwargs):
+        self.refresh()
+        return self.config.get(section, key, **kwargs)
 
     def set(self, section: str, key: str, value: str):
+        self.refresh()
+        if not self.config.has_section(section):
+            self.config.add_section(section)
         self.config.set(section, key, value)
-        with open(self.config_file, 'w') as f:
-            self.config.write(f)
+        self._dirty = True
+        if self._batch_depth == 0:
+            self._write()
 
-        self.config.read(self.config_file)
+    def vault_path(self, name):
+        # the data directory of a named vault, from the vaults section or vaults/NAME next to this config
+        if name == DEFAULT_VAULT:
+            return self.data_path
+        if not VAULT_NAME.match(name):
+            raise ValueError(f'invalid vault name: {name}')
+        return os.path.expanduser(self.get('vaults', name, fallback=f'{self.data_path}/vaults/{name}'))
+
+    def vault_names(self):
+        # the set up vaults, the default one first
+        names = []
+        if self.config.has_option('common', 'aes_key'):
+            names.append(DEFAULT_VAULT)
+        if self.config.has_section('vaults'):
+            names.extend(self.config.options('vaults'))
+        vaults_dir = f'{self.data_path}/vaults'
+        if os.path.isdir(vaults_dir):
+            names.extend(sorted(
+                name for name in os.listdir(vaults_dir)
+                if name not in names and os.path.isfile(f'{vaults_dir}/{name}/config.ini')
+            ))
+        return names
 
     def create_database_file(self, database_path=None):
         if database_path is not None:
@@ -46,150 +214,789 @@ class ConfUtils:
         conn = sqlite3.connect(self.database_file)
 
         # Create table
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS passwords (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name VARCHAR(200) NOT NULL UNIQUE,
-                login_name TEXT NOT NULL,
-                password TEXT NOT NULL,
-                memo TEXT NULL,
-                url VARCHAR(255) NULL
-            )
-        ''')
+        migrate(conn)
+        create_search_index(conn)
 
         conn.close()
 
-        self.config.read(self.config_file)
+
+class PasswordEntry:
+    # a row of the passwords table, login_name and password are decrypted on first access only
+    __slots__ = ('id', 'name', 'memo', 'url', 'encrypted_login_name', 'encrypted_password',
+                 '_login_name', '_password', '_password_manager')
+
+    def __init__(self, password_manager, id, name, login_name, password, memo, url):
+        self.id = id
+        self.name = name
+        self.memo = memo
+        self.url = url
+        self.encrypted_login_name = login_name
+        self.encrypted_password = password
+        self._login_name = None
+        self._password = None
+        self._password_manager = password_manager
+
+    @property
+    def login_name(self):
+        if self._login_name is None:
+            self._login_name = self._password_manager.aes_decrypt(self.encrypted_login_name)
+        return self._login_name
+
+    @property
+    def password(self):
+        if self._password is None:
+            self._password = self._password_manager.aes_decrypt(self.encrypted_password)
+        return self._password
+
+    def secret(self, field='password'):
+        # login_name or password decrypted into a SecretBuffer, wipe it when done
+        if field not in ('login_name', 'password'):
+            raise ValueError(f'{field} is not encrypted')
+        return self._password_manager.decrypt_secret(getattr(self, f'encrypted_{field}'))
+
+    def as_tuple(self):
+        # the raw row, in the column order of the table
+        return self.id, self.name, self.encrypted_login_name, self.encrypted_password, self.memo, self.url
+
+    def __getitem__(self, index):
+        return self.as_tuple()[index]
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+    def __len__(self):
+        return 6
+
+    def __eq__(self, other):
+        if isinstance(other, PasswordEntry):
+            other = other.as_tuple()
+        return self.as_tuple() == other
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return f'PasswordEntry(id={self.id!r}, name={self.name!r}, memo={self.memo!r}, url={self.url!r})'
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.added = 0
+        self.processed = 0
+        self.resumed_from = 0
+        # (name, reason) of every record that was not inserted
+        self.skipped = []
 
 
 class PasswordManager:
+    STATEMENT_CACHE_SIZE = 256
+    COLUMNS = 'passwords.id, passwords.name, passwords.login_name, passwords.password, passwords.memo, passwords.url'
+    INSERT_SQL = '''
+        INSERT INTO passwords (name, login_name, password, memo, url, login_index, name_lower)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
 
-    def __init__(self, conf_utils=None):
+    def __init__(self, conf_utils=None, search_index=True, cache=None):
         if conf_utils is None:
             self.conf_utils = ConfUtils()
         else:
             self.conf_utils = conf_utils
 
         self.database_file = self.conf_utils.get('db', 'database_file')
-        self.aes_key = self.conf_utils.get('common', 'aes_key')
+        # an optional SecretCache of decrypted entries, emptied by every write and key change
+        self.cache = cache
+        self._cache_version = None
+        self._cipher = None
+        self._secret_cipher = None
+        # keys that are being rotated out, still accepted for decryption
+        self._load_keys()
+
+        # one long-lived connection per manager, shared between threads behind the lock
+        self._conn = None
+        self._conn_stat = None
+        self._lock = threading.RLock()
+
+        self.search_index = search_index
+        self._search_index_ready = False
+        self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _configured_keys(self):
+        return (
+            self.conf_utils.get('common', 'aes_key'),
+            self.conf_utils.get('common', 'retired_keys', fallback=''),
+            self.conf_utils.get('common', 'login_index_key', fallback=''),
+        )
+
+    def _load_keys(self):
+        self._loaded_keys = self._configured_keys()
+        aes_key, retired_keys, login_index_key = self._loaded_keys
+        self.retired_keys = [key for key in retired_keys.split(',') if key]
+        self.aes_key = aes_key
+        self.login_index = LoginIndex(login_index_key) if login_index_key else None
+
+    def reload_keys(self):
+        # picks up a key rotation of another process or manager, a stat of the config file when nothing changed.
+        # the keys are compared too, a manager sharing the ConfUtils of the rotating one sees no file change
+        self.conf_utils.refresh()
+        if self._configured_keys() != self._loaded_keys:
+            self._load_keys()
+
+    def connect(self):
+        with self._lock:
+            if self._conn is not None and self._file_stat() != self._conn_stat:
+                # the database file was replaced or removed underneath us
+                self._close_connection()
+
+            if self._conn is None:
+                with instrument.timer('sqlite.connect'):
+                    conn = sqlite3.connect(self.database_file, check_same_thread=False,
+                                           cached_statements=self.STATEMENT_CACHE_SIZE)
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    migrate(conn)
+                    self._conn = conn
+                    self._conn_stat = self._file_stat()
+                    if self.search_index:
+                        self._search_index_ready = create_search_index(conn)
+
+            return self._conn
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        self._close_connection()
+
+    def _close_connection(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._conn_stat = None
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.database_file)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _checkpoint(self):
+        # flush the WAL into the main file so that file level copies are complete
+        with self._lock:
+            self.connect().execute('PRAGMA wal_checkpoint(TRUNCATE)')
 
     def add_password(self, name, login_name, password, memo=None, url=None):
-        conn = sqlite3.connect(self.database_file)
-        password = self.aes_encrypt(password)
-        login_name = self.aes_encrypt(login_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO passwords (name, login_name, password, memo, url)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, login_name, password, memo, url))
-        conn.commit()
-        conn.close()
+        login_name, password, login_index = self._encrypt_secrets(login_name, password)
+        self._insert_password((name, login_name, password, memo, url, login_index))
+
+    def _encrypt_secrets(self, login_name, password):
+        # the encrypted login_name and password and the blind index of the login name, None when it is disabled.
+        # a manager opened before a key rotation would otherwise keep writing with the retired key
+        self.reload_keys()
+        return self.aes_encrypt(login_name), self.aes_encrypt(password), self._login_digest(login_name)
+
+    def _insert_password(self, row):
+        # row is name, encrypted login_name, encrypted password, memo, url, login_index
+        with self._lock, instrument.timer('sqlite.write'), self.connect() as conn:
+            conn.execute(self.INSERT_SQL, self._with_name_lower(row))
+            self.invalidate_cache()
+
+    def add_passwords(self, records, batch_size=500, on_batch=None):
+        result = ImportResult()
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            self._insert_batch(self._encrypt_batch(batch, result), result)
+            result.processed += len(batch)
+            if on_batch is not None:
+                on_batch(result)
+
+        return result
+
+    def export(self, archive_file, compression=None):
+        # streams every entry into an archive, see archive.py. the encrypted fields are copied as they are,
+        # nothing is decrypted. one query on a connection of its own reads a consistent snapshot without
+        # holding the lock of the manager
+        from .archive import write_archive
 
-    def get_password(self, query_string):
         conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM passwords WHERE name LIKE ? OR url LIKE ? OR MEMO LIKE ?
-        ''', (f'%{query_string}%', f'%{query_string}%', f'%{query_string}%'))
-        result = cursor.fetchall()
-        conn.close()
+        try:
+            with instrument.timer('export'):
+                rows = conn.execute(f'SELECT {self.COLUMNS} FROM passwords ORDER BY id')
+                return write_archive(rows, archive_file, compression)
+        finally:
+            conn.close()
+
+    def import_archive(self, archive_file, names=None, batch_size=500, on_batch=None, offset=0):
+        # adds the entries of an archive made by export(), existing names are skipped. the archive has to be
+        # encrypted with a key of this vault. with names, only the blocks holding those entries are read
+        from cryptography.fernet import InvalidToken
+        from .archive import ArchiveError, ArchiveReader
+
+        result = ImportResult()
+        with ArchiveReader(archive_file) as archive:
+            if names is None:
+                rows = islice(archive, offset, None)
+            else:
+                rows = self._archive_rows(archive, names, result)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+
+                if not result.processed:
+                    try:
+                        self.aes_decrypt(batch[0][3])
+                    except InvalidToken:
+                        raise ArchiveError('The archive can not be decrypted with the configured AES key')
+                # the blind index of the archived entries is filled in by backfill_login_index()
+                self._insert_batch([row[1:] + (None,) for row in batch], result)
+                result.processed += len(batch)
+                if on_batch is not None:
+                    on_batch(result)
+
         return result
 
+    @staticmethod
+    def _archive_rows(archive, names, result):
+        for name in names:
+            row = archive.get_by_name(name)
+            if row is None:
+                result.skipped.append((name, 'not in the archive'))
+            else:
+                yield row
+
+    def _encrypt_batch(self, batch, result):
+        self.reload_keys()
+        rows = []
+        for record in batch:
+            try:
+                rows.append(self._encrypt_record(record))
+            except ValueError as e:
+                result.skipped.append((self._record_name(record), str(e)))
+        return rows
+
+    @staticmethod
+    def _with_name_lower(row):
+        # name_lower is computed here, the triggers of the schema only fold ASCII for other writers
+        return tuple(row) + (name_key(row[0]),)
+
+    def _insert_batch(self, rows, result):
+        rows = [self._with_name_lower(row) for row in rows]
+        with self._lock, instrument.timer('sqlite.write'):
+            conn = self.connect()
+            self.invalidate_cache()
+            try:
+                with conn:
+                    conn.executemany(self.INSERT_SQL, rows)
+                result.added += len(rows)
+            except sqlite3.IntegrityError:
+                # the chunk has been rolled back, insert it again row by row to skip the offending ones
+                with conn:
+                    for row in rows:
+                        try:
+                            conn.execute(self.INSERT_SQL, row)
+                            result.added += 1
+                        except sqlite3.IntegrityError as e:
+                            result.skipped.append((row[0], str(e)))
+
+    def _encrypt_record(self, record):
+        fields = ('name', 'login_name', 'password', 'memo', 'url')
+        if isinstance(record, (list, tuple)):
+            record = dict(zip(fields, record))
+        elif not isinstance(record, dict):
+            raise ValueError('the record is not an object')
+
+        values = {}
+        for field in fields:
+            value = record.get(field)
+            # numbers of a JSON file are stored as text, an empty CSV cell is no value
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            elif value is not None and not isinstance(value, (str, SecretBuffer)):
+                raise ValueError(f'{field} is not a string')
+            values[field] = value if value != '' else None
+
+        for field in ('name', 'login_name', 'password'):
+            if not values[field]:
+                raise ValueError(f'{field} is required')
+
+        login_name, password, login_index = self._encrypt_secrets(values['login_name'], values['password'])
+        return values['name'], login_name, password, values['memo'], values['url'], login_index
+
+    @staticmethod
+    def _record_name(record):
+        if isinstance(record, dict):
+            return record.get('name')
+        if isinstance(record, (list, tuple)) and record:
+            return record[0]
+        return None
+
+    def get_password(self, query_string):
+        return [entry for _, entry in self.search(query_string)]
+
+    def search(self, query_string):
+        # (score, entry) pairs, best first. scores are the bm25 ranks of the index, lower is better,
+        # and 0.0 for the matches of the substring search
+        with self._lock:
+            self.connect()
+            match = self._match_expression(query_string)
+            if self._search_index_ready and match:
+                with instrument.timer('sqlite.query'):
+                    cursor = self.connect().cursor()
+                    cursor.row_factory = self._make_ranked_entry
+                    result = cursor.execute(f'''
+                        SELECT {self.COLUMNS}, rank FROM passwords_fts
+                        JOIN passwords ON passwords.id = passwords_fts.rowid
+                        WHERE passwords_fts MATCH ? ORDER BY rank
+                    ''', (match,)).fetchall()
+                instrument.count('sqlite.rows', len(result))
+                if result:
+                    return result
+
+        # substring search, it also finds the matches inside words that the index can not
+        return [(0.0, entry) for entry in self.iter_passwords(query_string)]
+
+    def iter_passwords(self, query=None, batch_size=500):
+        # pages through the table by id, memory use does not depend on the size of the vault
+        sql = f'SELECT {self.COLUMNS} FROM passwords WHERE id > ?'
+        parameters = ()
+        if query is not None:
+            sql += ' AND (name LIKE ? OR url LIKE ? OR memo LIKE ?)'
+            parameters = (f'%{query}%', f'%{query}%', f'%{query}%')
+        sql += ' ORDER BY id LIMIT ?'
+
+        last_id = 0
+        while True:
+            # the lock is not held while the caller consumes the page
+            with self._lock:
+                rows = self._fetch_all(sql, (last_id,) + parameters + (batch_size,))
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1].id
+
+    def _select(self, sql, parameters=()):
+        # rows of the passwords table come back as PasswordEntry objects, call with the lock held
+        cursor = self.connect().cursor()
+        cursor.row_factory = self._make_entry
+        return cursor.execute(sql, parameters)
+
+    def _fetch_all(self, sql, parameters=()):
+        with instrument.timer('sqlite.query'):
+            rows = self._select(sql, parameters).fetchall()
+        instrument.count('sqlite.rows', len(rows))
+        return rows
+
+    def _fetch_one(self, sql, parameters=()):
+        with instrument.timer('sqlite.query'):
+            row = self._select(sql, parameters).fetchone()
+        instrument.count('sqlite.rows', 0 if row is None else 1)
+        return row
+
+    def _make_entry(self, cursor, row):
+        return PasswordEntry(self, *row)
+
+    def _make_ranked_entry(self, cursor, row):
+        return row[-1], PasswordEntry(self, *row[:-1])
+
+    @staticmethod
+    def _match_expression(query_string):
+        # every word of the query as a quoted prefix, the index tokenizer splits on underscores too
+        words = re.findall(r'[^\W_]+', query_string)
+        return ' '.join(f'"{word}"*' for word in words)
+
     def get_password_by_id(self, password_id):
-        conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM passwords WHERE id=?
+        return self._lookup(('id', password_id), f'''
+            SELECT {self.COLUMNS} FROM passwords WHERE id=?
         ''', (password_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
 
     def get_password_by_name(self, name):
-        conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM passwords WHERE name=?
+        return self._lookup(('name', name), f'''
+            SELECT {self.COLUMNS} FROM passwords WHERE name=?
         ''', (name,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
+
+    def _lookup(self, key, sql, parameters):
+        with self._lock:
+            if self.cache is None:
+                return self._fetch_one(sql, parameters)
+
+            self._check_cache()
+            entry = self.cache.get(key)
+            if entry is None:
+                entry = self._fetch_one(sql, parameters)
+                if entry is not None:
+                    # decrypt before caching, hits then cost no decryption at all
+                    entry.login_name, entry.password
+                    self.cache.put(key, entry)
+            return entry
+
+    def _check_cache(self):
+        # data_version moves when another connection commits, e.g. another mm process or a restore
+        conn = self.connect()
+        version = (conn, conn.execute('PRAGMA data_version').fetchone()[0])
+        if version != self._cache_version:
+            self.cache.clear()
+            self._cache_version = version
+
+    def invalidate_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def get_passwords_by_prefix(self, prefix, limit=None):
+        # entries whose name starts with prefix, ignoring case, in name order
+        prefix = name_key(prefix)
+        sql = f'SELECT {self.COLUMNS} FROM passwords WHERE name_lower >= ?'
+        parameters = (prefix,)
+        if prefix:
+            sql += ' AND name_lower < ?'
+            parameters += (prefix[:-1] + chr(ord(prefix[-1]) + 1),)
+        return self._fetch_range(sql + ' ORDER BY name_lower', parameters, limit)
+
+    def get_passwords_by_url(self, url, limit=None):
+        # entries whose url starts with url, e.g. every page of a site
+        sql = f'SELECT {self.COLUMNS} FROM passwords WHERE url >= ?'
+        parameters = (url,)
+        if url:
+            sql += ' AND url < ?'
+            parameters += (url[:-1] + chr(ord(url[-1]) + 1),)
+        return self._fetch_range(sql + ' ORDER BY url', parameters, limit)
+
+    def get_passwords_by_login(self, login_name):
+        # entries with this login name, ignoring case. with the login index enabled this is an index lookup plus
+        # the rows not indexed yet, without it every login name is decrypted. the candidates are decrypted
+        # and compared, a stale index value left by another writer never gives a wrong match
+        wanted = normalize_login(login_name)
+        with self._lock:
+            if self.login_index is None:
+                candidates = self._fetch_all(f'SELECT {self.COLUMNS} FROM passwords ORDER BY id')
+            else:
+                low, high = self.login_index.key_range
+                # no ORDER BY, sqlite answers every term of the OR from the index then
+                candidates = sorted(self._fetch_all(f'''
+                    SELECT {self.COLUMNS} FROM passwords
+                    WHERE login_index = ? OR login_index IS NULL OR login_index < ? OR login_index > ?
+                ''', (self.login_index.digest(wanted), low, high)), key=lambda entry: entry.id)
+        return [entry for entry in candidates if normalize_login(entry.login_name) == wanted]
+
+    def _login_digest(self, login_name):
+        if self.login_index is None:
+            return None
+        if isinstance(login_name, SecretBuffer):
+            # hashed from the buffer, no str copy of an ASCII login name is left behind
+            return self.login_index.digest(login_name.view)
+        return self.login_index.digest(login_name)
+
+    def enable_login_index(self):
+        # creates the key of the blind index, run backfill_login_index() afterwards for the existing entries
+        if self.login_index is None:
+            self.conf_utils.set('common', 'login_index_key', generate_login_index_key())
+            self._load_keys()
+        return self.login_index
+
+    def disable_login_index(self):
+        with self._lock, instrument.timer('sqlite.write'), self.connect() as conn:
+            conn.execute('UPDATE passwords SET login_index = NULL WHERE login_index IS NOT NULL')
+        self.conf_utils.set('common', 'login_index_key', '')
+        self._load_keys()
+
+    def backfill_login_index(self, batch_size=1000, progress=None):
+        # indexes the entries added before the index was enabled, by other writers or from archives and
+        # restores, one batch per transaction. the lock is released in between, returns the entries indexed
+        if self.login_index is None:
+            raise ValueError('The login index is not enabled')
+
+        low, high = self.login_index.key_range
+        indexed = 0
+        last_id = 0
+        while True:
+            with self._lock:
+                conn = self.connect()
+                rows = conn.execute('''
+                    SELECT id, login_name FROM passwords
+                    WHERE id > ? AND (login_index IS NULL OR login_index < ? OR login_index > ?)
+                    ORDER BY id LIMIT ?
+                ''', (last_id, low, high, batch_size)).fetchall()
+                if not rows:
+                    break
+                updates = [
+                    (self.login_index.digest(self.aes_decrypt(login_name)), password_id, login_name)
+                    for password_id, login_name in rows
+                ]
+                with instrument.timer('sqlite.write'), conn:
+                    # a row changed since it was read keeps its value, the next run indexes it
+                    conn.executemany('UPDATE passwords SET login_index = ? WHERE id = ? AND login_name = ?', updates)
+            indexed += len(rows)
+            last_id = rows[-1][0]
+            if progress is not None:
+                progress(indexed)
+        return indexed
+
+    def _fetch_range(self, sql, parameters, limit):
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters += (limit,)
+        with self._lock:
+            return self._fetch_all(sql, parameters)
 
     def get_all_passwords(self):
-        conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM passwords
-        ''')
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return list(self.iter_passwords())
 
     def update_password(self, password_id, name, login_name, password, memo=None, url=None):
-        login_name = self.aes_encrypt(login_name)
-        password = self.aes_encrypt(password)
-        conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE passwords
-            SET name=?, login_name=?, password=?, memo=?, url=?
-            WHERE id=?
-        ''', (name, login_name, password, memo, url, password_id))
-        conn.commit()
-        conn.close()
+        login_name, password, login_index = self._encrypt_secrets(login_name, password)
+        self._update_password(password_id, (name, login_name, password, memo, url, login_index))
+
+    def _update_password(self, password_id, row):
+        with self._lock, instrument.timer('sqlite.write'), self.connect() as conn:
+            conn.execute('''
+                UPDATE passwords
+                SET name=?, login_name=?, password=?, memo=?, url=?, login_index=?, name_lower=?
+                WHERE id=?
+            ''', self._with_name_lower(row) + (password_id,))
+            # a rename that keeps the folded name, e.g. 'ÜBER' to 'Über', leaves name_lower as it was and the
+            # update trigger replaced it with the ASCII lower() of the new name
+            conn.execute('UPDATE passwords SET name_lower=? WHERE id=? AND name_lower IS NOT ?',
+                         (name_key(row[0]), password_id, name_key(row[0])))
+            self.invalidate_cache()
 
     def delete_password(self, password_id):
-        conn = sqlite3.connect(self.database_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            DELETE FROM passwords WHERE id=?
-        ''', (password_id,))
-        conn.commit()
-        conn.close()
+        with self._lock, instrument.timer('sqlite.write'), self.connect() as conn:
+            conn.execute('''
+                DELETE FROM passwords WHERE id=?
+            ''', (password_id,))
+            self.invalidate_cache()
 
-    def backup_db(self, backup_file=None):
-        if backup_file is None:
-            now = datetime.datetime.now()
-            date_str = now.strftime('%Y%m%d%H%M%S')
-            name, extension = os.path.splitext(self.database_file)
-            backup_file = f'{name}_bak_{date_str}{extension}'
+    def rotate_key(self, new_key=None, chunk_size=1000, processes=None, progress=None):
+        from concurrent.futures import ProcessPoolExecutor
+        from cryptography.fernet import Fernet
 
-        shutil.copyfile(self.database_file, backup_file)
+        if new_key is None:
+            new_key = Fernet.generate_key().decode()
+        self.reload_keys()
+        keys = [new_key, self.aes_key] + self.retired_keys
 
-        return backup_file
+        # save the keys first, every reader can decrypt rows in either state while the rotation runs
+        with self.conf_utils.batch():
+            self.conf_utils.set('common', 'retired_keys', ','.join(keys[1:]))
+            self.conf_utils.set('common', 'aes_key', new_key)
+        self._load_keys()
+
+        rotate = partial(_rotate_rows, keys)
+        rotated = 0
+        start = time.perf_counter()
+        with self._lock:
+            conn = self.connect()
+            total = conn.execute('SELECT COUNT(*) FROM passwords').fetchone()[0]
+            if processes is None:
+                processes = min(os.cpu_count() or 1, max(total // chunk_size, 1))
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                chunks = self._iter_secret_chunks(conn, chunk_size)
+                if processes > 1:
+                    executor = ProcessPoolExecutor(max_workers=processes)
+                    results = _ordered_map(executor, rotate, chunks, processes * 2)
+                else:
+                    executor = None
+                    results = map(rotate, chunks)
+
+                try:
+                    for rows in results:
+                        conn.executemany('UPDATE passwords SET login_name=?, password=? WHERE id=?', rows)
+                        rotated += len(rows)
+                        if progress is not None:
+                            progress(rotated, total, rotated / (time.perf_counter() - start))
+                finally:
+                    if executor is not None:
+                        executor.shutdown()
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+        # every row is encrypted with the new key now
+        self.conf_utils.set('common', 'retired_keys', '')
+        self._load_keys()
+
+        return new_key
+
+    @staticmethod
+    def _iter_secret_chunks(conn, chunk_size):
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, login_name, password FROM passwords WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def backup_db(self, backup_file=None, incremental=False, progress=None):
+        # progress(status, remaining, total) is called after every step of pages
+        with instrument.timer('backup'):
+            if incremental:
+                return IncrementalBackup(self.database_file).backup(progress=progress)
 
-    def upload_db(self):
-        self.conf_utils.config.read(self.conf_utils.config_file)
+            if backup_file is None:
+                backup_file = backup_file_name(self.database_file)
+            return snapshot(self.database_file, backup_file, progress=progress)
 
+    def prune_backups(self, keep_full=3):
+        IncrementalBackup(self.database_file, keep_full=keep_full).prune()
+
+    @property
+    def session(self):
+        # pooled HTTP connections, reused by every cloud request of this manager
+        if self._session is None:
+            from .cloud import create_session
+
+            self._session = create_session()
+        return self._session
+
+    def upload_db(self, chunked=False, chunk_size=None, progress=None, delta=False):
         url = self.conf_utils.get('common', 'cloud_api')
         token = self.conf_utils.get('common', 'cloud_token')
+        if delta:
+            # an out of date upload applies the remote changes first, entries changed on both sides are kept
+            # and listed in response.conflicts with a 409
+            response = DeltaSync(self, url, token).upload()
+            self.invalidate_cache()
+            if response.status_code not in UNSUPPORTED_STATUS:
+                return response
+
+        if chunked:
+            from .cloud import CHUNK_SIZE, ChunkedUploader
+
+            uploader = ChunkedUploader(url, token, session=self.session, chunk_size=chunk_size or CHUNK_SIZE)
+            return uploader.upload(self.database_file, progress=progress)
+
+        self._checkpoint()
         with open(self.database_file, 'rb') as file:
             headers = {
                 'Content-Type': 'application/octet-stream',
                 'Authorization': f'Bearer {token}'
             }
 
-            response = requests.post(url, headers=headers, data=file)
+            with instrument.timer('cloud.upload'):
+                response = self.session.post(url, headers=headers, data=file)
+            instrument.count('cloud.bytes_uploaded', file.tell())
 
             return response
 
-    def restore_db(self):
+    def restore_db(self, delta=False):
         url = self.conf_utils.get('common', 'cloud_api')
         token = self.conf_utils.get('common', 'cloud_token')
+        if delta:
+            # the remote changes are applied in place, the database file is not replaced
+            response = DeltaSync(self, url, token).restore()
+            self.invalidate_cache()
+            if response.status_code not in UNSUPPORTED_STATUS:
+                return response
+
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {token}'
         }
-        # need to check the content of the response if it is a valid database file?
-        response = requests.post(url, headers=headers)
-        if response.status_code == 200:
-            # before writing the file, need to check if the response content is a valid database file
-            with open(self.database_file, 'wb') as file:
-                file.write(response.content)
+        with instrument.timer('cloud.restore'):
+            response = self.session.post(url, headers=headers, stream=True)
+        if response.status_code != 200:
+            return response
+
+        # the download goes to a file next to the database and replaces it only once it is verified
+        tmp_file = f'{self.database_file}.restore'
+        try:
+            with instrument.timer('cloud.download'), response, open(tmp_file, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=RESTORE_READ_SIZE):
+                    file.write(chunk)
+                instrument.count('cloud.bytes_downloaded', file.tell())
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        response.backup_file = self._install_database(tmp_file)
         return response
 
+    def _install_database(self, tmp_file):
+        # swaps a downloaded database in once it is verified, returns the backup of the previous one
+        try:
+            with instrument.timer('verify'):
+                self.verify_database(tmp_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        with self._lock:
+            backup_file = None
+            if os.path.exists(self.database_file):
+                backup_file = self.backup_db()
+
+            conn = self.connect()
+            source = sqlite3.connect(tmp_file)
+            try:
+                # copied into the live database, the WAL and other open connections stay consistent
+                source.backup(conn)
+            except sqlite3.OperationalError:
+                # a WAL database can not change its page size, swap the file when no one else has it open
+                source.close()
+                self._close_connection()
+                os.replace(tmp_file, self.database_file)
+                conn = self.connect()
+            else:
+                source.close()
+                os.remove(tmp_file)
+                # the restored database may come from an older version
+                migrate(conn)
+            if self.search_index:
+                self._search_index_ready = create_search_index(conn)
+            self.invalidate_cache()
+        return backup_file
+
+    def verify_database(self, database_file):
+        from cryptography.fernet import InvalidToken
+
+        with open(database_file, 'rb') as f:
+            if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+                raise InvalidDatabaseError('The file is not a SQLite database')
+
+        conn = sqlite3.connect(database_file)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise InvalidDatabaseError(f'The database is corrupted: {result}')
+
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(passwords)')}
+            missing = {'id', 'name', 'login_name', 'password', 'memo', 'url'} - columns
+            if missing:
+                raise InvalidDatabaseError(f'The passwords table is missing the columns {", ".join(sorted(missing))}')
+
+            row = conn.execute('SELECT login_name, password FROM passwords LIMIT 1').fetchone()
+            if row is not None:
+                try:
+                    self.aes_decrypt(row[0])
+                    self.aes_decrypt(row[1])
+                except InvalidToken:
+                    raise InvalidDatabaseError('The passwords can not be decrypted with the configured AES key')
+        except sqlite3.DatabaseError as e:
+            raise InvalidDatabaseError(f'The database can not be read: {e}')
+        finally:
+            conn.close()
+
     def destroy_db(self):
+        self.invalidate_cache()
+        self.close()
         if os.path.exists(self.database_file):
             os.remove(self.database_file)
         files = glob.glob(f'{self.conf_utils.data_path}/*')
@@ -199,13 +1006,62 @@ class PasswordManager:
         if os.path.exists(self.conf_utils.config_file):
             os.remove(self.conf_utils.config_file)
 
+    @property
+    def aes_key(self):
+        return self._aes_key
+
+    @aes_key.setter
+    def aes_key(self, value):
+        self._aes_key = value
+        self._cipher = None
+        self._secret_cipher = None
+        self.invalidate_cache()
+
+    @property
+    def cipher(self):
+        # building a Fernet decodes the key and splits it into signing and encryption keys, do it once
+        if self._cipher is None:
+            # cryptography is only imported once something has to be encrypted or decrypted
+            from cryptography.fernet import Fernet, MultiFernet
+
+            if self.retired_keys:
+                keys = [self.aes_key] + self.retired_keys
+                self._cipher = MultiFernet([Fernet(key.encode()) for key in keys])
+            else:
+                self._cipher = Fernet(self.aes_key.encode())
+        return self._cipher
+
+    @property
+    def secret_cipher(self):
+        if self._secret_cipher is None:
+            from .secret import SecretCipher
+
+            self._secret_cipher = SecretCipher([self.aes_key] + self.retired_keys)
+        return self._secret_cipher
+
     def aes_encrypt(self, data):
-        f = Fernet(self.aes_key.encode())
-        return f.encrypt(data.encode()).decode()
+        # data is a str or a SecretBuffer, the plaintext copies made on the way from a SecretBuffer are zeroed
+        with instrument.timer('crypto.encrypt'):
+            if isinstance(data, SecretBuffer):
+                return self.secret_cipher.encrypt(data)
+            return self.cipher.encrypt(data.encode()).decode()
 
     def aes_decrypt(self, encrypt_data):
-        f = Fernet(self.aes_key.encode())
-        return f.decrypt(encrypt_data.encode()).decode()
+        with instrument.timer('crypto.decrypt'):
+            return self.cipher.decrypt(encrypt_data).decode()
+
+    def decrypt_secret(self, encrypt_data):
+        # a SecretBuffer that the caller wipes, no str copy of the plaintext is made
+        with instrument.timer('crypto.decrypt'):
+            return self.secret_cipher.decrypt(encrypt_data)
+
+    def aes_encrypt_bytes(self, data):
+        with instrument.timer('crypto.encrypt'):
+            return self.cipher.encrypt(data)
+
+    def aes_decrypt_bytes(self, encrypt_data):
+        with instrument.timer('crypto.decrypt'):
+            return self.cipher.decrypt(encrypt_data)
 
 
 
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import instrument
+from .backup import snapshot
+
+CHUNK_SIZE = 4 * 1024 * 1024
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# an interrupted upload older than this starts over with a new snapshot
+RESUME_MAX_AGE = 24 * 60 * 60
+
+
+def create_session(pool_size=4):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ChunkedUploader:
+    # uploads a snapshot of the database in compressed chunks, an interrupted upload resumes
+    # from the last chunk acknowledged by the server
+
+    def __init__(self, url, token, session=None, chunk_size=CHUNK_SIZE, retries=5, backoff=0.5, timeout=60):
+        self.url = url
+        self.token = token
+        self.session = session if session is not None else create_session()
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def upload(self, database_file, progress=None):
+        # response.resumed_from is the number of chunks an earlier run had already sent, 0 for a new upload
+        state_file = f'{database_file}.upload'
+        state = self._load_state(state_file, database_file)
+        if state is None:
+            snapshot_file = f'{database_file}.upload.snapshot'
+            # taken before the snapshot, a write during it makes the snapshot stale for the next run
+            database_stamp = self._database_stamp(database_file)
+            snapshot(database_file, snapshot_file)
+            state = {
+                'snapshot': snapshot_file,
+                'upload_id': self._file_hash(snapshot_file),
+                'size': os.path.getsize(snapshot_file),
+                'chunk_size': self.chunk_size,
+                'acknowledged': 0,
+                'database': database_stamp,
+                'created': time.time(),
+            }
+            self._save_state(state_file, state)
+
+        chunk_size = state['chunk_size']
+        chunk_count = max((state['size'] + chunk_size - 1) // chunk_size, 1)
+        acknowledged = self._server_acknowledged(state)
+        if acknowledged is None:
+            acknowledged = state['acknowledged']
+        resumed_from = acknowledged
+
+        response = None
+        with open(state['snapshot'], 'rb') as f:
+            for index in range(acknowledged, chunk_count):
+                f.seek(index * chunk_size)
+                chunk = f.read(chunk_size)
+                response = self._send_chunk(state, index, chunk_count, chunk)
+                if response.status_code != 200:
+                    response.resumed_from = resumed_from
+                    return response
+
+                state['acknowledged'] = index + 1
+                self._save_state(state_file, state)
+                if progress is not None:
+                    progress(index + 1, chunk_count)
+
+        if response is None:
+            # every chunk had been acknowledged before, ask the server to confirm the upload
+            response = self._request('GET', self._headers(state))
+
+        os.remove(state['snapshot'])
+        os.remove(state_file)
+        response.resumed_from = resumed_from
+        return response
+
+    def _send_chunk(self, state, index, chunk_count, chunk):
+        headers = self._headers(state)
+        headers.update({
+            'Content-Type': 'application/octet-stream',
+            'Content-Encoding': 'deflate',
+            'X-Chunk-Index': str(index),
+            'X-Chunk-Count': str(chunk_count),
+            'X-Chunk-Sha256': hashlib.sha256(chunk).hexdigest(),
+        })
+        data = zlib.compress(chunk)
+        instrument.count('cloud.bytes_uploaded', len(data))
+        with instrument.timer('cloud.upload'):
+            return self._request('POST', headers, data)
+
+    def _server_acknowledged(self, state):
+        try:
+            response = self._request('GET', self._headers(state))
+        except requests.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return int(response.json()['acknowledged'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _headers(self, state):
+        return {
+            'Authorization': f'Bearer {self.token}',
+            'X-Upload-Id': state['upload_id'],
+            'X-Upload-Size': str(state['size']),
+        }
+
+    def _request(self, method, headers, data=None):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, self.url, headers=headers, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return response
+            time.sleep(self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def _file_hash(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _database_stamp(database_file):
+        # (mtime, size) of the database and its WAL, a commit changes at least one of them
+        stamp = []
+        for path in (database_file, f'{database_file}-wal'):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stamp.append(None)
+            else:
+                stamp.append([st.st_mtime_ns, st.st_size])
+        return stamp
+
+    @classmethod
+    def _load_state(cls, state_file, database_file):
+        # the state of an interrupted upload, None when there is none or its snapshot is out of date
+        try:
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(state['snapshot']):
+            return None
+        if (state.get('database') != cls._database_stamp(database_file)
+                or time.time() - state.get('created', 0) > RESUME_MAX_AGE):
+            # resuming would upload the snapshot without the edits made since, or one that is too old
+            os.remove(state['snapshot'])
+            return None
+        return state
+
+    @staticmethod
+    def _save_state(state_file, state):
+        tmp_file = f'{state_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, state_file)
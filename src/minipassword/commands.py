@@ -3,33 +3,83 @@ import os
 import re
 import argparse
 import sys
+import time
+
+from . import instrument
+from .box import ConfUtils, InvalidDatabaseError, PasswordManager
+from .script import AgentClient, ScriptHandler, add_script_commands, agent_socket_path
+from .secret import SecretBuffer, write_secret
+
+# simple_term_menu, cryptography and requests are imported on the code paths that need them,
+# tests/test_imports.py keeps them out of the start up of the command
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Mini Password is a command-line password manager.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-a', '--add', action='store_true', help='add a new password')
+    group.add_argument('-d', '--delete', action='store_true', help='delete a password')
+    group.add_argument('-u', '--update', action='store_true', help='update a password')
+    group.add_argument('-l', '--list-file', action='store_true', help='list database file and configuration file paths')
+    group.add_argument('-b', '--backup', action='store_true', help='backup the database file')
+    group.add_argument('-p', '--upload', action='store_true', help='upload the database file to a cloud service')
+    group.add_argument('-r', '--restore', action='store_true', help='restore the database file from cloud service')
+    group.add_argument('-api', '--api', action='store_true', help='set cloud API url and token')
+    group.add_argument('-i', '--import', dest='import_file', metavar='FILE', help='import passwords from a JSON, JSON lines or CSV file')
+    group.add_argument('-e', '--export', dest='export_file', metavar='FILE',
+                       help='export all passwords, still encrypted, to a compressed archive that -i imports')
+    group.add_argument('-k', '--rotate-key', action='store_true', help='generate a new AES key and re-encrypt all passwords')
+    group.add_argument('--index-logins', action='store_true',
+                       help='index the login names for PasswordManager.get_passwords_by_login, or catch up the index')
+    group.add_argument('-s', '--search', action='store_true', help='search as you type')
+    group.add_argument('--agent', action='store_true', help='keep the vault open and serve mm COMMAND from memory until interrupted')
+    group.add_argument('-dd', '--destroy', action='store_true', help='destroy the database, all data will be lost!')
+    parser.add_argument('--vault', metavar='NAME',
+                        help='use the named vault instead of the default one, it is set up on first use')
+    parser.add_argument('--incremental', action='store_true', help='with -b, only store the pages changed since the last backup')
+    parser.add_argument('--chunked', action='store_true', help='with -p, upload in compressed chunks that resume after a failure')
+    parser.add_argument('--delta', action='store_true', help='with -p or -r, only transfer the entries changed since the last sync')
+    parser.add_argument('--idle-timeout', type=float, metavar='SECONDS',
+                        help='with --agent, forget the decrypted entries after this many idle seconds (default 900)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print where the time went (config, SQLite, crypto, network) to stderr when done')
+    parser.add_argument('--profile-output', metavar='FILE', help='also write a cProfile dump to FILE')
+    add_script_commands(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    return build_parser().parse_args(argv)
 
-from simple_term_menu import TerminalMenu
-from cryptography.fernet import Fernet
-from .box import ConfUtils, PasswordManager
 
+class CommandHandler:
 
-parser = argparse.ArgumentParser(description='Mini Password is a command-line password manager.')
-group = parser.add_mutually_exclusive_group()
-group.add_argument('-a', '--add', action='store_true', help='add a new password')
-group.add_argument('-d', '--delete', action='store_true', help='delete a password')
-group.add_argument('-u', '--update', action='store_true', help='update a password')
-group.add_argument('-l', '--list-file', action='store_true', help='list database file and configuration file paths')
-group.add_argument('-b', '--backup', action='store_true', help='backup the database file')
-group.add_argument('-p', '--upload', action='store_true', help='upload the database file to a cloud service')
-group.add_argument('-r', '--restore', action='store_true', help='restore the database file from cloud service')
-group.add_argument('-api', '--api', action='store_true', help='set cloud API url and token')
-group.add_argument('-dd', '--destroy', action='store_true', help='destroy the database, all data will be lost!')
-args = parser.parse_args()
-
+    def __init__(self, args=None):
+        if args is None:
+            args = parse_args()
 
-class CommandHandler:
+        self.args = args
+        self.instrumentation = None
+        self.profiler = None
+        if args.profile or args.profile_output:
+            self.start_profile()
 
-    def __init__(self):
-        if len(sys.argv) > 2:
-            print('Only one argument is allowed!')
+        self.data_path = None
+        if args.vault is not None:
+            try:
+                self.data_path = ConfUtils().vault_path(args.vault)
+            except ValueError as e:
+                print(f'{e}!', file=sys.stderr)
+                sys.exit(1)
+
+        self.agent_client = None
+        if args.command is not None:
+            # with a running agent mm COMMAND is a thin client, the vault is not opened here at all
+            self.agent_client = AgentClient.connect(agent_socket_path(self.data_path))
+            if self.agent_client is not None:
+                return
 
-        self.conf_utils = ConfUtils()
+        self.conf_utils = ConfUtils(data_path=self.data_path)
         self.run_trigger = True
         self.add_arg = args.add
         self.delete_arg = args.delete
@@ -40,6 +90,15 @@ class CommandHandler:
         self.upload_arg = args.upload
         self.restore_arg = args.restore
         self.api_arg = args.api
+        self.import_arg = args.import_file
+        self.export_arg = args.export_file
+        self.index_logins_arg = args.index_logins
+        self.search_arg = args.search
+        self.rotate_key_arg = args.rotate_key
+        self.incremental_arg = args.incremental
+        self.chunked_arg = args.chunked
+        self.delta_arg = args.delta
+        self.agent_arg = args.agent
 
 
         try:
@@ -48,22 +107,28 @@ class CommandHandler:
         except (configparser.NoSectionError, configparser.NoOptionError):
 
             self.run_trigger = False
+            if args.command is not None:
+                # scripts never get the first run prompts
+                print('Mini Password is not set up yet, run mm once interactively.', file=sys.stderr)
+                sys.exit(1)
             try:
                 res = input(f'Enter the database file path ({self.conf_utils.data_path}/{self.conf_utils.DB_FILENAME}): ')
-                if res == '':
-                    self.conf_utils.create_database_file()
-                else:
-                    self.conf_utils.create_database_file(res)
+                # the database path and the key are written together, an interrupted setup leaves no half config
+                with self.conf_utils.batch():
+                    if res == '':
+                        self.conf_utils.create_database_file()
+                    else:
+                        self.conf_utils.create_database_file(res)
 
-                df = self.conf_utils.get('db', 'database_file')
-                print(f'Database file created: {df}')
+                    df = self.conf_utils.get('db', 'database_file')
+                    print(f'Database file created: {df}')
 
-                aes_key = Fernet.generate_key()
-                aes_key_string = aes_key.decode('utf-8')
-                self.conf_utils.set('common', 'aes_key', aes_key_string)
-                print(f'AES key is generated, please keep it in a safe place: {aes_key_string}')
+                    from cryptography.fernet import Fernet
 
-                self.conf_utils.config.read(self.conf_utils.config_file)
+                    aes_key = Fernet.generate_key()
+                    aes_key_string = aes_key.decode('utf-8')
+                    self.conf_utils.set('common', 'aes_key', aes_key_string)
+                print(f'AES key is generated, please keep it in a safe place: {aes_key_string}')
             except KeyboardInterrupt:
                 print('Interrupted by user!')
                 return
@@ -71,6 +136,22 @@ class CommandHandler:
         self.password_manager = PasswordManager(conf_utils=self.conf_utils)
 
     def run(self):
+        try:
+            self._run()
+        finally:
+            if self.instrumentation is not None:
+                self.finish_profile()
+
+    def _run(self):
+
+        if self.args.command is not None:
+            if self.agent_client is not None:
+                code = ScriptHandler(None, self.args, client=self.agent_client).run()
+            else:
+                code = ScriptHandler(self.password_manager, self.args).run()
+            if code:
+                sys.exit(code)
+            return
 
         if self.add_arg:
             self.add_password()
@@ -104,6 +185,26 @@ class CommandHandler:
             self.set_api_token()
             return
 
+        if self.import_arg:
+            self.import_passwords()
+            return
+
+        if self.export_arg:
+            self.export_passwords()
+            return
+
+        if self.index_logins_arg:
+            self.index_logins()
+            return
+
+        if self.rotate_key_arg:
+            self.rotate_key()
+            return
+
+        if self.agent_arg:
+            self.run_agent()
+            return
+
         if self.destroy_arg:
             confirm = input('Are you sure you want to destroy the database file? If you have backups, ensure that you also have the secret key to restore (Y/n):')
             if confirm == 'Y':
@@ -114,6 +215,10 @@ class CommandHandler:
         if not self.run_trigger:
             return
 
+        if self.search_arg:
+            self.incremental_search()
+            return
+
         os.system('clear')
         try:
             query_string = input('Enter a query string: ')
@@ -122,9 +227,11 @@ class CommandHandler:
                 if len(passwords) == 1:
                     self.show_password(passwords[0])
                 else:
+                    from simple_term_menu import TerminalMenu
+
                     menu_items = []
                     for password in passwords:
-                        item = f'#{password[0]} \| {password[1]} \| {password[5]} \| {password[4]}'
+                        item = f'#{password.id} \| {password.name} \| {password.url} \| {password.memo}'
                         if len(item) > 40:
                             item = item[:40] + '...'
                         menu_items.append(item)
@@ -139,6 +246,80 @@ class CommandHandler:
             print('Interrupted by user!')
             return
 
+    def start_profile(self):
+        self.profile_start = time.perf_counter()
+        self.instrumentation = instrument.enable()
+        if self.args.profile_output:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def finish_profile(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.args.profile_output)
+        instrument.disable()
+        self.instrumentation.record('command', time.perf_counter() - self.profile_start)
+        print(self.instrumentation.report(), file=sys.stderr)
+        if self.profiler is not None:
+            print(f'cProfile dump written to {self.args.profile_output}', file=sys.stderr)
+
+    def incremental_search(self, limit=10):
+        import termios
+        import tty
+        from .search import FuzzyIndex
+
+        index = FuzzyIndex.from_manager(self.password_manager)
+        query = ''
+        selected = 0
+        results = index.search(query, limit)
+
+        fd = sys.stdin.fileno()
+        old_settings = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            while True:
+                lines = [f'\x1b[2J\x1b[HSearch ({len(index)} entries): {query}', '']
+                for i, (password_id, name, url, memo) in enumerate(results):
+                    item = f'#{password_id} | {name} | {url} | {memo}'
+                    if len(item) > 60:
+                        item = item[:60] + '...'
+                    lines.append(f'{">" if i == selected else " "} {item}')
+                sys.stdout.write('\n'.join(lines))
+                sys.stdout.flush()
+
+                key = os.read(fd, 3).decode(errors='ignore')
+                if key in ('\r', '\n'):
+                    break
+                if key in ('\x1b', '\x03', '\x04'):
+                    results = []
+                    break
+                if key == '\x1b[A':
+                    selected = max(selected - 1, 0)
+                    continue
+                if key == '\x1b[B':
+                    selected = min(selected + 1, max(len(results) - 1, 0))
+                    continue
+                if key in ('\x7f', '\x08'):
+                    query = query[:-1]
+                elif key.isprintable():
+                    query += key
+                else:
+                    continue
+                results = index.search(query, limit)
+                selected = 0
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+            print()
+
+        if not results:
+            print('No password found!')
+            return
+
+        # only the selected entry is read again and decrypted
+        self.show_password(self.password_manager.get_password_by_id(results[selected][0]))
+
     def add_password(self):
         try:
             os.system('clear')
@@ -197,27 +378,28 @@ class CommandHandler:
                 return
 
             password_obj = self.password_manager.get_password_by_id(password_id)
-            name = input(f'Enter the name ({password_obj[1]}): ')
+            name = input(f'Enter the name ({password_obj.name}): ')
             if name == '':
-                name = password_obj[1]
+                name = password_obj.name
             else:
-                if self.password_manager.get_password_by_name(name) and name != password_obj[1]:
+                if self.password_manager.get_password_by_name(name) and name != password_obj.name:
                     print(f'Password already exists! (name is {name})')
                     return
-            original_login_name = self.password_manager.aes_decrypt(password_obj[2])
+            original_login_name = password_obj.login_name
             login_name = input(f'Enter the login name ({original_login_name}): ')
             if login_name == '':
                 login_name = original_login_name
 
             password = input('Enter the password: ')
             if password == '':
-                password = self.password_manager.aes_decrypt(password_obj[3])
-            memo = input(f'\n\n({password_obj[4]})\n\nEnter the memo: ')
+                # the current password is re-encrypted from a buffer that is wiped below, never as a str
+                password = password_obj.secret('password')
+            memo = input(f'\n\n({password_obj.memo})\n\nEnter the memo: ')
             if memo == '':
-                memo = password_obj[4]
-            url = input(f'Enter the url ({password_obj[5]}): ')
+                memo = password_obj.memo
+            url = input(f'Enter the url ({password_obj.url}): ')
             if url == '':
-                url = password_obj[5]
+                url = password_obj.url
 
             if url != '' and not self.is_valid_url(url):
                 while True:
@@ -225,17 +407,100 @@ class CommandHandler:
                     if self.is_valid_url(url):
                         break
 
-            self.password_manager.update_password(password_id, name, login_name, password, memo, url)
+            try:
+                self.password_manager.update_password(password_id, name, login_name, password, memo, url)
+            finally:
+                if isinstance(password, SecretBuffer):
+                    password.wipe()
             print('Password updated!')
         except KeyboardInterrupt:
             print('Interrupted by user!')
             return
 
+    def import_passwords(self):
+        from .importer import import_file
+
+        checkpoint_file = f'{self.conf_utils.data_path}/import.checkpoint'
+
+        def progress(processed, result):
+            print(f'\r{processed} records processed, {result.added} imported', end='', flush=True)
+
+        try:
+            result = import_file(self.password_manager, self.import_arg, checkpoint_file=checkpoint_file,
+                                 progress=progress)
+        except KeyboardInterrupt:
+            print('\nInterrupted by user! Run the same command again to resume the import.')
+            return
+        except (OSError, ValueError) as e:
+            print(f'\nImport failed! {e}')
+            return
+
+        print()
+        if result.resumed_from:
+            print(f'Resumed after {result.resumed_from} records.')
+        for name, reason in result.skipped:
+            print(f'Skipped {name}: {reason}')
+        print(f'{result.added} passwords imported, {len(result.skipped)} skipped.')
+
+    def export_passwords(self):
+        try:
+            count = self.password_manager.export(self.export_arg)
+        except (OSError, ValueError) as e:
+            print(f'Export failed! {e}')
+            return
+        print(f'{count} passwords exported to {self.export_arg}, they can only be imported with the current AES key.')
+
+    def index_logins(self):
+        self.password_manager.enable_login_index()
+
+        def progress(indexed):
+            print(f'\r{indexed} login names indexed', end='', flush=True)
+
+        try:
+            indexed = self.password_manager.backfill_login_index(progress=progress)
+        except KeyboardInterrupt:
+            print('\nInterrupted by user! Run the same command again to index the rest.')
+            return
+        if indexed:
+            print()
+        print(f'The login names are indexed, {indexed} entries were added to the index.')
+
+    def rotate_key(self):
+        confirm = input('Are you sure you want to rotate the AES key? Backups made before will still need the old key (Y/n): ')
+        if confirm != 'Y':
+            return
+
+        def progress(rotated, total, rate):
+            print(f'\r{rotated}/{total} passwords re-encrypted, {rate:.0f} rows/s', end='', flush=True)
+
+        aes_key = self.password_manager.rotate_key(progress=progress)
+        print(f'\nAES key is rotated, please keep the new key in a safe place: {aes_key}')
+
+    def run_agent(self):
+        from .agent import IDLE_TIMEOUT, Agent, AgentRunningError
+
+        agent = Agent(self.password_manager, socket_path=agent_socket_path(self.data_path),
+                      idle_timeout=self.args.idle_timeout or IDLE_TIMEOUT)
+        print(f'Agent listening on {agent.socket_path}, press Ctrl+C to stop.')
+        try:
+            agent.run()
+        except AgentRunningError as e:
+            print(f'{e}!')
+            return
+        print('Agent stopped.')
+
     def list_files(self):
+        if self.args.vault is not None:
+            print(f'vault: {self.args.vault}')
         print(f'database file: {self.conf_utils.get("db", "database_file")}')
         print(f'configuration file: {self.conf_utils.config_file}')
 
     def backup_db(self):
+        if self.incremental_arg:
+            backup_file = self.password_manager.backup_db(incremental=True)
+            print(f'Database file backed up to {backup_file}')
+            return
+
         backup_file = input('Please enter the backup file path and file name (the default location is in the same folder as the database file): ')
         if backup_file == '':
             backup_file = self.password_manager.backup_db()
@@ -245,11 +510,25 @@ class CommandHandler:
 
     def upload(self):
         if self.check_api_token():
-            result = self.password_manager.upload_db()
+            if self.chunked_arg:
+                result = self.password_manager.upload_db(
+                    chunked=True,
+                    delta=self.delta_arg,
+                    progress=lambda sent, total: print(f'\r{sent}/{total} chunks uploaded', end='', flush=True)
+                )
+                print()
+                if getattr(result, 'resumed_from', 0):
+                    print(f'Resumed an interrupted upload after {result.resumed_from} chunks, '
+                          f'the database has not changed since.')
+            else:
+                result = self.password_manager.upload_db(delta=self.delta_arg)
             if result.status_code == 200:
                 # todo: need to check the server response a valid message
                 print(f'Database file uploaded to cloud! {result.text}')
                 print(f'API url: {self.conf_utils.get("common", "cloud_api")}')
+            elif getattr(result, 'conflicts', None):
+                print(f'Upload stopped! These entries were also changed in the cloud: {", ".join(result.conflicts)}')
+                print('The local versions are kept, upload again to replace the cloud versions with them.')
             else:
                 print(f'Upload failed! {result.status_code} {result.text}')
                 print(f'API url: {self.conf_utils.get("common", "cloud_api")}')
@@ -259,9 +538,17 @@ class CommandHandler:
             url = self.conf_utils.get('common', 'cloud_api')
             confirm = input(f'Are you sure you want to restore the database file from the cloud service? \nPlease ensure that the API URL provided is valid: {url} (Y/n): ')
             if confirm == 'Y':
-                result = self.password_manager.restore_db()
+                try:
+                    result = self.password_manager.restore_db(delta=self.delta_arg)
+                except InvalidDatabaseError as e:
+                    print(f'Restored failed! {e}, the database file is unchanged.')
+                    return
                 if result.status_code == 200:
                     print(f'Database file restored!')
+                    if getattr(result, 'backup_file', None):
+                        print(f'Previous database file backed up to {result.backup_file}')
+                    if getattr(result, 'conflicts', None):
+                        print(f'Kept the local versions of entries not uploaded yet: {", ".join(result.conflicts)}')
                     print(f'API url: {self.conf_utils.get("common", "cloud_api")}')
                     print(f'Database file path: {self.conf_utils.get("db", "database_file")}')
                 else:
@@ -270,14 +557,17 @@ class CommandHandler:
 
     def show_password(self, selected_password):
         print('+++++++++++++++++++++++++++++++')
-        password = self.password_manager.aes_decrypt(selected_password[3])
-        login_name = self.password_manager.aes_decrypt(selected_password[2])
-        print(f'\nlogin name: {login_name}')
-        print(f'password: {password} \n\n')
-        print(f'id: {selected_password[0]}')
-        print(f'name: {selected_password[1]}')
-        print(f'url: {selected_password[5]}')
-        print(f'memo: {selected_password[4]}\n')
+        # the secrets go from their buffers to stdout, no str copies stay behind
+        with selected_password.secret('login_name') as login_name, selected_password.secret('password') as password:
+            sys.stdout.write('\nlogin name: ')
+            write_secret(sys.stdout, login_name)
+            sys.stdout.write('\npassword: ')
+            write_secret(sys.stdout, password)
+            sys.stdout.write(' \n\n\n')
+        print(f'id: {selected_password.id}')
+        print(f'name: {selected_password.name}')
+        print(f'url: {selected_password.url}')
+        print(f'memo: {selected_password.memo}\n')
         print('+++++++++++++++++++++++++++++++')
 
     def check_api_token(self):
@@ -305,8 +595,9 @@ class CommandHandler:
                 print('Cloud API token is required!')
                 return False
 
-            self.conf_utils.set('common', 'cloud_api', url)
-            self.conf_utils.set('common', 'cloud_token', token)
+            with self.conf_utils.batch():
+                self.conf_utils.set('common', 'cloud_api', url)
+                self.conf_utils.set('common', 'cloud_token', token)
         except KeyboardInterrupt:
             print('Interrupted by user!')
             return False
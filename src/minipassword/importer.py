@@ -0,0 +1,151 @@
+import csv
+import itertools
+import json
+import os
+import re
+
+from .archive import is_archive
+
+READ_SIZE = 64 * 1024
+FORMATS = ('json', 'jsonl', 'csv')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def detect_format(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.json':
+        return 'json'
+    if is_archive(file_path):
+        return 'archive'
+
+    # no telling extension, look at the first character of the file
+    with open(file_path, 'r', encoding='utf-8-sig') as file:
+        head = file.read(READ_SIZE).lstrip()
+    if head.startswith('['):
+        return 'json'
+    if head.startswith('{'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_json(file):
+    # stream the elements of a top level JSON array without loading the whole document
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, started = '', 0, False, False
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer):
+            char = buffer[pos]
+            if not started:
+                if char != '[':
+                    raise ValueError('The JSON file must contain an array of records')
+                started = True
+                pos += 1
+                continue
+            if char == ']':
+                return
+            if char == ',':
+                pos += 1
+                continue
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the record is cut by the end of the buffer, unless there is nothing left to read
+                if eof:
+                    raise
+            else:
+                yield record
+                continue
+        elif eof:
+            raise ValueError('Unexpected end of the JSON file')
+
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_jsonl(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(file):
+    yield from csv.DictReader(file)
+
+
+def iter_records(file_path, file_format=None):
+    if file_format is None:
+        file_format = detect_format(file_path)
+    if file_format not in FORMATS:
+        raise ValueError(f'Unsupported import format: {file_format}')
+
+    readers = {'json': iter_json, 'jsonl': iter_jsonl, 'csv': iter_csv}
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as file:
+        yield from readers[file_format](file)
+
+
+class ImportCheckpoint:
+
+    def __init__(self, checkpoint_file, source_file):
+        self.checkpoint_file = checkpoint_file
+        self.source = os.path.abspath(source_file)
+
+    def load(self):
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+        # a checkpoint left by the import of another file does not apply
+        if data.get('source') != self.source:
+            return 0
+        return int(data.get('offset', 0))
+
+    def save(self, offset):
+        tmp_file = f'{self.checkpoint_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'source': self.source, 'offset': offset}, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def remove(self):
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+
+def import_file(password_manager, file_path, file_format=None, checkpoint_file=None, batch_size=500,
+                progress=None):
+    checkpoint = None
+    offset = 0
+    if checkpoint_file is not None:
+        checkpoint = ImportCheckpoint(checkpoint_file, file_path)
+        offset = checkpoint.load()
+
+    def on_batch(result):
+        if checkpoint is not None:
+            checkpoint.save(offset + result.processed)
+        if progress is not None:
+            progress(offset + result.processed, result)
+
+    if file_format is None:
+        file_format = detect_format(file_path)
+    if file_format == 'archive':
+        # the entries of an archive are inserted as they are, without being encrypted again
+        result = password_manager.import_archive(file_path, batch_size=batch_size, on_batch=on_batch, offset=offset)
+    else:
+        records = itertools.islice(iter_records(file_path, file_format), offset, None)
+        result = password_manager.add_passwords(records, batch_size=batch_size, on_batch=on_batch)
+    result.resumed_from = offset
+
+    if checkpoint is not None:
+        checkpoint.remove()
+
+    return result
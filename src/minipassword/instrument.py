@@ -0,0 +1,112 @@
+import threading
+import time
+
+# timers and counters of the hot paths, off unless enable() is called. a disabled timer() or count() is a global
+# lookup and a None check, cheap enough for every query, decrypt and chunk
+_active = None
+
+
+class Instrumentation:
+    # hooks are called as hook(kind, name, value), kind is 'timer' with the seconds of one call
+    # or 'count' with the amount added
+
+    def __init__(self, hooks=()):
+        self.timers = {}
+        self.counters = {}
+        self.hooks = list(hooks)
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def record(self, name, seconds):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+        for hook in self.hooks:
+            hook('timer', name, seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook('count', name, value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'timers': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.timers.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self):
+        lines = [f'{"operation":<24} {"calls":>8} {"total ms":>10} {"mean us":>10}']
+        with self._lock:
+            for name, (calls, seconds) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+                lines.append(f'{name:<24} {calls:>8} {seconds * 1000:>10.2f} {seconds / calls * 1e6:>10.1f}')
+            if self.counters:
+                lines.append('')
+                lines.append(f'{"counter":<24} {"value":>8}')
+                for name, value in sorted(self.counters.items()):
+                    lines.append(f'{name:<24} {value:>8}')
+        return '\n'.join(lines)
+
+
+class Timer:
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def enable(instrumentation=None):
+    # instruments the whole process, returns the Instrumentation collecting the numbers
+    global _active
+    _active = instrumentation if instrumentation is not None else Instrumentation()
+    return _active
+
+
+def disable():
+    global _active
+    instrumentation, _active = _active, None
+    return instrumentation
+
+
+def active():
+    return _active
+
+
+def timer(name):
+    if _active is None:
+        return NULL_TIMER
+    return Timer(_active, name)
+
+
+def count(name, value=1):
+    if _active is not None:
+        _active.count(name, value)
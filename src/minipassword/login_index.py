@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import hmac
+import os
+import unicodedata
+
+# a blind index of the login names: a keyed HMAC of the normalized login name, stored next to the encrypted
+# one. equal login names get equal values, so it tells which entries share a login, but not the login itself.
+# every value starts with an id of its key, values of another key (e.g. from a database restored into a
+# vault with its own index key) sort outside of KEY_ID .. KEY_ID + ff... and are treated as not indexed
+DIGEST_SIZE = 16
+KEY_ID_SIZE = 4
+# what str.strip() removes in the ASCII range
+ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+
+def generate_key():
+    return base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+
+def normalize_login(login_name):
+    return unicodedata.normalize('NFKC', login_name).strip().casefold()
+
+
+class LoginIndex:
+
+    def __init__(self, key):
+        key = base64.urlsafe_b64decode(key)
+        self.key_id = hashlib.sha256(b'minipassword login index ' + key).digest()[:KEY_ID_SIZE]
+        # the values of this key are key_id followed by DIGEST_SIZE bytes, they all sort between these two
+        self.key_range = (self.key_id, self.key_id + b'\xff' * (DIGEST_SIZE + 1))
+        self._hmac = hmac.new(key, digestmod=hashlib.sha256)
+
+    def digest(self, login_name):
+        # login_name is a str or its utf-8 bytes, e.g. the view of a SecretBuffer
+        mac = self._hmac.copy()
+        if isinstance(login_name, str) or any(byte > 0x7f for byte in login_name):
+            # NFKC and casefold only exist for str, a login that is not ASCII is decoded for them
+            if not isinstance(login_name, str):
+                login_name = str(login_name, 'utf-8')
+            mac.update(normalize_login(login_name).encode('utf-8'))
+        else:
+            self._update_ascii(mac, login_name)
+        return self.key_id + mac.digest()[:DIGEST_SIZE]
+
+    @staticmethod
+    def _update_ascii(mac, data):
+        # normalize_login() of ASCII bytes done on a copy that is zeroed afterwards, NFKC leaves ASCII as it is
+        # and casefold is lower
+        normalized = bytearray(data)
+        try:
+            for i, byte in enumerate(normalized):
+                if 0x41 <= byte <= 0x5a:
+                    normalized[i] = byte + 0x20
+            start, end = 0, len(normalized)
+            while start < end and normalized[start] in ASCII_WHITESPACE:
+                start += 1
+            while end > start and normalized[end - 1] in ASCII_WHITESPACE:
+                end -= 1
+            with memoryview(normalized) as view:
+                mac.update(view[start:end])
+        finally:
+            normalized[:] = bytes(len(normalized))
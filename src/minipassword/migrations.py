@@ -0,0 +1,118 @@
+from .sync import CHANGE_LOG_UPDATE_TRIGGER
+
+# every migration upgrades the schema by one version, PRAGMA user_version holds the version of a database.
+# databases created before the migrations existed are at version 0 and already have the passwords table
+
+
+def name_key(name):
+    # the case insensitive form of a name stored in name_lower. SQLite's lower() only folds ASCII letters,
+    # PasswordManager computes the column and the prefixes of the lookups with this function
+    return None if name is None else name.casefold()
+
+
+def create_passwords_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS passwords (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(200) NOT NULL UNIQUE,
+            login_name TEXT NOT NULL,
+            password TEXT NOT NULL,
+            memo TEXT NULL,
+            url VARCHAR(255) NULL
+        )
+    ''')
+
+
+def add_url_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS passwords_url ON passwords (url)')
+
+
+def add_name_lower(conn):
+    # the lowercase name for case insensitive prefix lookups. PasswordManager writes it along with the name,
+    # the triggers cover every other writer
+    conn.execute('ALTER TABLE passwords ADD COLUMN name_lower VARCHAR(200) NULL')
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='passwords_changes_update'").fetchone():
+        # the change log trigger fired on updates of any column, the backfill below is not a change to sync
+        conn.execute('DROP TRIGGER passwords_changes_update')
+        conn.execute(CHANGE_LOG_UPDATE_TRIGGER)
+    conn.execute('UPDATE passwords SET name_lower = lower(name)')
+    conn.execute('CREATE INDEX passwords_name_lower ON passwords (name_lower)')
+    conn.execute('''
+        CREATE TRIGGER passwords_name_lower_insert AFTER INSERT ON passwords
+        WHEN new.name_lower IS NOT lower(new.name) BEGIN
+            UPDATE passwords SET name_lower = lower(new.name) WHERE id = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER passwords_name_lower_update AFTER UPDATE OF name, name_lower ON passwords
+        WHEN new.name_lower IS NOT lower(new.name) BEGIN
+            UPDATE passwords SET name_lower = lower(new.name) WHERE id = new.id;
+        END
+    ''')
+
+
+def add_login_index(conn):
+    # the blind index of the login names, see login_index.py. it stays empty unless the index is enabled,
+    # the change log trigger only fires on updates of the synced columns, so the backfill is not a change
+    conn.execute('ALTER TABLE passwords ADD COLUMN login_index BLOB NULL')
+    conn.execute('CREATE INDEX passwords_login_index ON passwords (login_index)')
+
+
+def casefold_name_lower(conn):
+    # name_lower was filled with lower(), which leaves non-ASCII names as they are
+    conn.execute('DROP TRIGGER IF EXISTS passwords_name_lower_insert')
+    conn.execute('DROP TRIGGER IF EXISTS passwords_name_lower_update')
+    rows = [(name_key(name), row_id) for row_id, name, name_lower in conn.execute(
+        'SELECT id, name, name_lower FROM passwords') if name_lower != name_key(name)]
+    conn.executemany('UPDATE passwords SET name_lower = ? WHERE id = ?', rows)
+
+
+def sql_name_lower_triggers(conn):
+    # the triggers only cover writers that do not know the column, with the ASCII lower() of SQLite. they use
+    # no function of ours, so older releases, the sqlite3 shell and other tools can still write to the vault
+    conn.execute('DROP TRIGGER IF EXISTS passwords_name_lower_insert')
+    conn.execute('DROP TRIGGER IF EXISTS passwords_name_lower_update')
+    conn.execute('''
+        CREATE TRIGGER passwords_name_lower_insert AFTER INSERT ON passwords
+        WHEN new.name_lower IS NULL BEGIN
+            UPDATE passwords SET name_lower = lower(new.name) WHERE id = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER passwords_name_lower_update AFTER UPDATE OF name ON passwords
+        WHEN new.name IS NOT old.name AND new.name_lower IS old.name_lower BEGIN
+            UPDATE passwords SET name_lower = lower(new.name) WHERE id = new.id;
+        END
+    ''')
+
+
+MIGRATIONS = (
+    create_passwords_table,
+    add_url_index,
+    add_name_lower,
+    add_login_index,
+    casefold_name_lower,
+    sql_name_lower_triggers,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    # applies the missing migrations, each in its own transaction. returns the version the database had
+    version = schema_version(conn)
+    for number in range(version, SCHEMA_VERSION):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # another process may have migrated the database while we waited for the lock
+            if schema_version(conn) <= number:
+                MIGRATIONS[number](conn)
+                conn.execute(f'PRAGMA user_version = {number + 1}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return version
@@ -0,0 +1,227 @@
+import json
+import os
+import socket
+import sqlite3
+import sys
+
+from . import instrument
+
+FIELDS = ('id', 'name', 'login_name', 'password', 'memo', 'url')
+
+
+class ScriptError(Exception):
+    pass
+
+
+def agent_socket_path(data_path=None):
+    # every vault has its own agent, the variable only moves the one of the default vault
+    if data_path is not None:
+        return f'{data_path}/agent.sock'
+    return os.environ.get('MINIPASSWORD_AGENT_SOCK') or f'{os.path.expanduser("~")}/.minipassword/agent.sock'
+
+
+def add_script_commands(parser):
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND',
+                                       help='non-interactive commands for scripts, see mm COMMAND -h')
+
+    get = subparsers.add_parser('get', help='print an entry, looked up by its name')
+    get.add_argument('entry_name', metavar='NAME')
+    get.add_argument('--field', choices=FIELDS, help='print only this field')
+    get.add_argument('--json', action='store_true', dest='json_output', help='print JSON')
+
+    add = subparsers.add_parser('add', help='add an entry')
+    add.add_argument('entry_name', metavar='NAME')
+    add.add_argument('--login-name', required=True)
+    add_secret_arguments(add)
+
+    update = subparsers.add_parser('update', help='update the given fields of an entry')
+    update.add_argument('entry_name', metavar='NAME')
+    update.add_argument('--new-name')
+    update.add_argument('--login-name')
+    add_secret_arguments(update)
+
+    delete = subparsers.add_parser('delete', help='delete an entry')
+    delete.add_argument('entry_name', metavar='NAME')
+    delete.add_argument('--json', action='store_true', dest='json_output', help='print JSON')
+
+    subparsers.add_parser('batch', help='run the JSON requests read from stdin, one per line, '
+                                        'e.g. {"op": "get", "name": "Google", "field": "password"}')
+
+
+def add_secret_arguments(parser):
+    secret = parser.add_mutually_exclusive_group()
+    secret.add_argument('--password')
+    secret.add_argument('--password-stdin', action='store_true', help='read the password from the first line of stdin')
+    parser.add_argument('--memo')
+    parser.add_argument('--url')
+    parser.add_argument('--json', action='store_true', dest='json_output', help='print JSON')
+
+
+class ScriptHandler:
+    # the commands of CommandHandler without prompts or screen clearing, for scripts
+
+    def __init__(self, password_manager, args, stdin=None, stdout=None, stderr=None, client=None):
+        self.password_manager = password_manager
+        self.args = args
+        # an AgentClient, the requests are then served by mm --agent instead of password_manager
+        self.client = client
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+
+    def run(self):
+        args = self.args
+        if args.command == 'batch':
+            return self.batch()
+
+        request = {'op': args.command, 'name': args.entry_name}
+        for key in ('field', 'new_name', 'login_name', 'password', 'memo', 'url'):
+            value = getattr(args, key, None)
+            if value is not None:
+                request[key] = value
+        if getattr(args, 'password_stdin', False):
+            request['password'] = self.stdin.readline().rstrip('\n')
+
+        try:
+            result = self.dispatch(request)
+        except ScriptError as e:
+            if args.json_output:
+                self.write_json({'ok': False, 'error': str(e)})
+            else:
+                print(f'Error: {e}', file=self.stderr)
+            return 1
+
+        if args.json_output:
+            self.write_json(result)
+        elif 'value' in result:
+            print(result['value'], file=self.stdout)
+        elif 'entry' in result:
+            for field in FIELDS:
+                print(f'{field}: {result["entry"][field]}', file=self.stdout)
+        return 0
+
+    def batch(self):
+        # one JSON result per request line, a failed request does not stop the batch
+        code = 0
+        for line in self.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ScriptError('a request is a JSON object')
+                result = self.dispatch(request)
+            except ValueError as e:
+                result, code = {'ok': False, 'error': f'invalid request: {e}'}, 1
+            except ScriptError as e:
+                result, code = {'ok': False, 'error': str(e)}, 1
+            self.write_json(result)
+        return code
+
+    def dispatch(self, request):
+        if self.client is not None:
+            return self.client.execute(request)
+        return self.execute(request)
+
+    def execute(self, request):
+        operation = request.get('op')
+        name = request.get('name')
+        if not name:
+            raise ScriptError('name is required')
+
+        if operation == 'get':
+            entry = self.password_manager.get_password_by_name(name)
+            if entry is None:
+                raise ScriptError(f'no entry named {name}')
+            return self.get_result({field: getattr(entry, field) for field in FIELDS}, request.get('field'))
+
+        if operation == 'add':
+            for field in ('login_name', 'password'):
+                if not request.get(field):
+                    raise ScriptError(f'{field} is required')
+            try:
+                self.password_manager.add_password(name, request['login_name'], request['password'],
+                                                   request.get('memo'), request.get('url'))
+            except sqlite3.IntegrityError:
+                raise ScriptError(f'an entry named {name} already exists')
+            return {'ok': True, 'name': name}
+
+        if operation == 'update':
+            entry = self.password_manager.get_password_by_name(name)
+            if entry is None:
+                raise ScriptError(f'no entry named {name}')
+            new_name = request.get('new_name') or name
+            try:
+                self.password_manager.update_password(
+                    entry.id,
+                    new_name,
+                    request.get('login_name') or entry.login_name,
+                    request.get('password') or entry.password,
+                    request.get('memo', entry.memo),
+                    request.get('url', entry.url),
+                )
+            except sqlite3.IntegrityError:
+                raise ScriptError(f'an entry named {new_name} already exists')
+            return {'ok': True, 'name': new_name}
+
+        if operation == 'delete':
+            entry = self.password_manager.get_password_by_name(name)
+            if entry is None:
+                raise ScriptError(f'no entry named {name}')
+            self.password_manager.delete_password(entry.id)
+            return {'ok': True, 'name': name}
+
+        raise ScriptError(f'unknown op {operation}')
+
+    @staticmethod
+    def get_result(entry, field=None):
+        if field is None:
+            return {'ok': True, 'entry': entry}
+        if field not in FIELDS:
+            raise ScriptError(f'unknown field {field}')
+        return {'ok': True, 'name': entry['name'], 'field': field, 'value': entry[field]}
+
+    def write_json(self, data):
+        self.stdout.write(json.dumps(data, ensure_ascii=False) + '\n')
+        self.stdout.flush()
+
+
+class AgentClient:
+    # sends the requests of mm COMMAND to a running mm --agent, one JSON line each way
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    @classmethod
+    def connect(cls, socket_path=None):
+        # None when no agent is listening
+        socket_path = socket_path or agent_socket_path()
+        if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock)
+
+    def execute(self, request):
+        try:
+            with instrument.timer('agent.request'):
+                self.sock.sendall(json.dumps(request, ensure_ascii=False).encode() + b'\n')
+                line = self.rfile.readline()
+        except OSError as e:
+            raise ScriptError(f'lost the connection to the agent: {e}')
+        if not line:
+            raise ScriptError('the agent closed the connection')
+
+        result = json.loads(line)
+        if not result.get('ok'):
+            raise ScriptError(result.get('error'))
+        return result
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
@@ -0,0 +1,122 @@
+import re
+from bisect import bisect_left, bisect_right
+
+_WORD = re.compile(r'[^\W_]+')
+# a query held by up to FEW_ENTRIES entries is located in the text of all entries and ranked exactly. a broader
+# one is only checked against the SCAN_BUDGET best ranked entries, and the subsequence pass looks at no more
+# than FUZZY_BUDGET entries, so a keystroke never walks a whole large vault in Python
+FEW_ENTRIES = 1024
+SCAN_BUDGET = 5000
+FUZZY_BUDGET = 4000
+
+
+class FuzzyIndex:
+    # in memory index of the non secret columns for search as you type, nothing is decrypted here
+
+    def __init__(self, rows):
+        self.entries = list(rows)
+        self._haystacks = [' '.join(part or '' for part in row[1:]).lower() for row in self.entries]
+
+        # ties are broken by the length of an entry, then by its position. rank is the place of an entry in
+        # that order
+        self._by_rank = sorted(range(len(self.entries)), key=lambda i: (len(self._haystacks[i]), i))
+        self._rank = [0] * len(self.entries)
+        for rank, i in enumerate(self._by_rank):
+            self._rank[i] = rank
+
+        # every entry on a line of its own, a query holds no whitespace and never spans two lines.
+        # starts has the offset of every line
+        self._text = '\n'.join(self._haystacks)
+        self._starts = []
+        offset = 0
+        for haystack in self._haystacks:
+            self._starts.append(offset)
+            offset += len(haystack) + 1
+
+        # the distinct words of the names, sorted, and the sorted ranks of the entries holding each of them
+        ranks = {}
+        for i, row in enumerate(self.entries):
+            for word in set(_WORD.findall((row[1] or '').lower())):
+                ranks.setdefault(word, []).append(self._rank[i])
+        self._words = sorted(ranks)
+        self._word_ranks = [sorted(ranks[word]) for word in self._words]
+
+        # every entry holding the last located query, a longer query only looks at them
+        self._last_query = None
+        self._last_entries = None
+
+    @classmethod
+    def from_manager(cls, password_manager):
+        with password_manager._lock:
+            cursor = password_manager.connect().execute('SELECT id, name, url, memo FROM passwords ORDER BY id')
+            return cls(cursor.fetchall())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=20, scan_limit=200):
+        query = ''.join(query.lower().split())
+        if not query:
+            return self.entries[:limit]
+
+        # word prefixes of the name first, then substrings by position, then subsequences by compactness.
+        # the regex pass of the subsequences stops after scan_limit matches
+        ranked = self._word_prefixes(query, limit)
+        if len(ranked) < limit:
+            ranked += self._substrings(query, set(ranked), limit - len(ranked))
+        if len(ranked) < limit:
+            ranked += self._subsequences(query, set(ranked), limit - len(ranked), scan_limit)
+        return [self.entries[i] for i in ranked]
+
+    def _word_prefixes(self, query, limit):
+        start = bisect_left(self._words, query)
+        end = bisect_left(self._words, query[:-1] + chr(ord(query[-1]) + 1), start)
+        # only the best limit entries of every word can be among the best limit entries of all of them
+        ranks = set()
+        for word_ranks in self._word_ranks[start:end]:
+            ranks.update(word_ranks[:limit])
+        return [self._by_rank[rank] for rank in sorted(ranks)[:limit]]
+
+    def _substrings(self, query, exclude, limit):
+        if self._last_query is not None and query.startswith(self._last_query):
+            entries = [i for i in self._last_entries if query in self._haystacks[i]]
+        else:
+            entries = self._locate(query)
+        if entries is not None:
+            self._last_query, self._last_entries = query, entries
+        else:
+            # too many entries hold the query to rank them all, the best ranked ones fill the results
+            self._last_query = None
+            entries = [i for i in self._by_rank[:SCAN_BUDGET] if query in self._haystacks[i]]
+
+        scored = [(self._haystacks[i].find(query), self._rank[i], i) for i in entries if i not in exclude]
+        scored.sort()
+        return [i for _, _, i in scored[:limit]]
+
+    def _locate(self, query):
+        # the entries holding query found in the text of all entries, None when there are more than FEW_ENTRIES
+        entries = []
+        pos = self._text.find(query)
+        while pos >= 0:
+            if len(entries) == FEW_ENTRIES:
+                return None
+            i = bisect_right(self._starts, pos) - 1
+            entries.append(i)
+            if i + 1 == len(self._starts):
+                break
+            pos = self._text.find(query, self._starts[i + 1])
+        return entries
+
+    def _subsequences(self, query, exclude, limit, scan_limit):
+        pattern = re.compile('.*?'.join(map(re.escape, query)))
+        scores = {}
+        for i in self._by_rank[:FUZZY_BUDGET]:
+            if i in exclude:
+                continue
+            match = pattern.search(self._haystacks[i])
+            if match is None:
+                continue
+            scores[i] = (match.end() - match.start(), match.start(), self._rank[i])
+            if len(scores) >= scan_limit:
+                break
+        return sorted(scores, key=scores.get)[:limit]
@@ -0,0 +1,169 @@
+import base64
+import binascii
+import hmac
+import os
+import struct
+import time
+
+# Fernet tokens decrypted into buffers that can be zeroed. the format is the one of cryptography's Fernet:
+# version 0x80, 8 byte timestamp, 16 byte iv, AES-128-CBC ciphertext, 32 byte HMAC-SHA256 of all of it
+VERSION = 0x80
+HEADER_SIZE = 25
+MAC_SIZE = 32
+BLOCK_SIZE = 16
+PADDING = [bytes((size,)) * size for size in range(BLOCK_SIZE + 1)]
+
+
+class SecretBuffer:
+    # plaintext in a bytearray that wipe() zeroes, also when used as a context manager or garbage collected.
+    # view is a memoryview of the secret without a copy, decode() makes the str copy callers may still need
+    __slots__ = ('_buffer', '_length')
+
+    def __init__(self, buffer, length=None):
+        self._buffer = buffer
+        self._length = len(buffer) if length is None else length
+
+    @classmethod
+    def from_str(cls, value):
+        # encodes straight into the buffer, no intermediate bytes object
+        return cls(bytearray(value, 'utf-8'))
+
+    @property
+    def view(self):
+        return memoryview(self._buffer)[:self._length]
+
+    @property
+    def wiped(self):
+        return self._buffer is None
+
+    def decode(self, encoding='utf-8'):
+        return str(self.view, encoding)
+
+    def wipe(self):
+        if self._buffer is not None:
+            self._buffer[:] = bytes(len(self._buffer))
+            self._buffer = None
+            self._length = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wipe()
+
+    def __del__(self):
+        self.wipe()
+
+    def __len__(self):
+        return self._length
+
+    def __eq__(self, other):
+        if isinstance(other, SecretBuffer):
+            other = other.view
+        elif isinstance(other, str):
+            other = other.encode('utf-8')
+        return hmac.compare_digest(self.view, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'SecretBuffer(<{self._length} bytes>)'
+
+
+class SecretCipher:
+    # Fernet and MultiFernet compatible, the first key encrypts and every key decrypts
+
+    def __init__(self, keys):
+        from cryptography.fernet import InvalidToken
+        from cryptography.hazmat.primitives.ciphers import Cipher
+        from cryptography.hazmat.primitives.ciphers.algorithms import AES
+        from cryptography.hazmat.primitives.ciphers.modes import CBC
+        from cryptography.hazmat.primitives.hashes import SHA256
+        from cryptography.hazmat.primitives.hmac import HMAC
+
+        self._invalid_token = InvalidToken
+        self._new_cipher = Cipher
+        self._mode = CBC
+        # a keyed HMAC to copy and the AES of every key, copying is half the cost of keying a new HMAC
+        self._keys = []
+        for key in keys:
+            key = base64.urlsafe_b64decode(key)
+            if len(key) != 32:
+                raise ValueError('Fernet key must be 32 url-safe base64-encoded bytes.')
+            self._keys.append((HMAC(key[:16], SHA256()), AES(key[16:])))
+
+    def decrypt(self, token):
+        InvalidToken = self._invalid_token
+        try:
+            data = base64.urlsafe_b64decode(token)
+        except (TypeError, binascii.Error):
+            raise InvalidToken
+        if len(data) < HEADER_SIZE + BLOCK_SIZE + MAC_SIZE or data[0] != VERSION \
+                or (len(data) - HEADER_SIZE - MAC_SIZE) % BLOCK_SIZE:
+            raise InvalidToken
+
+        signed = memoryview(data)[:-MAC_SIZE]
+        for signing, aes in self._keys:
+            mac = signing.copy()
+            mac.update(signed)
+            if hmac.compare_digest(mac.finalize(), data[-MAC_SIZE:]):
+                break
+        else:
+            raise InvalidToken
+
+        ciphertext = signed[HEADER_SIZE:]
+        decryptor = self._new_cipher(aes, self._mode(data[9:HEADER_SIZE])).decryptor()
+        # update_into writes the plaintext straight into the buffer that is handed out
+        buffer = bytearray(len(ciphertext) + BLOCK_SIZE - 1)
+        length = decryptor.update_into(ciphertext, buffer)
+        decryptor.finalize()
+
+        padding = buffer[length - 1]
+        if not 0 < padding <= BLOCK_SIZE or buffer.count(padding, length - padding, length) != padding:
+            SecretBuffer(buffer).wipe()
+            raise InvalidToken
+        return SecretBuffer(buffer, length - padding)
+
+    def encrypt(self, data):
+        # data is a SecretBuffer, str or bytes-like object, the copies made of it here are zeroed afterwards
+        if isinstance(data, str):
+            plaintext = bytearray(data, 'utf-8')
+            try:
+                return self._encrypt(plaintext)
+            finally:
+                plaintext[:] = bytes(len(plaintext))
+        if isinstance(data, SecretBuffer):
+            # data stays referenced until the view is done with, a collected SecretBuffer is wiped
+            return self._encrypt(data.view)
+        return self._encrypt(data)
+
+    def _encrypt(self, plaintext):
+        length = len(plaintext)
+        padding = BLOCK_SIZE - length % BLOCK_SIZE
+        padded = bytearray(length + padding)
+        try:
+            padded[:length] = plaintext
+            padded[length:] = PADDING[padding]
+            signing, aes = self._keys[0]
+            iv = os.urandom(BLOCK_SIZE)
+            encryptor = self._new_cipher(aes, self._mode(iv)).encryptor()
+            ciphertext = encryptor.update(padded)
+            encryptor.finalize()
+        finally:
+            padded[:] = bytes(len(padded))
+
+        token = b'\x80' + struct.pack('>Q', int(time.time())) + iv + ciphertext
+        mac = signing.copy()
+        mac.update(token)
+        return base64.urlsafe_b64encode(token + mac.finalize()).decode()
+
+
+def write_secret(stream, secret):
+    # writes the bytes of a SecretBuffer to a text stream, through its binary buffer when it has one
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is None:
+        stream.write(secret.decode())
+        return
+    stream.flush()
+    buffer.write(secret.view)
+    buffer.flush()
@@ -0,0 +1,190 @@
+from . import instrument
+
+CHANGE_LOG_UPDATE_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS passwords_changes_update AFTER UPDATE OF name, login_name, password, memo, url ON passwords
+    WHEN NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying' AND value = 1) BEGIN
+        INSERT INTO passwords_changes (name, operation) SELECT old.name, 'delete' WHERE old.name != new.name;
+        INSERT INTO passwords_changes (name, operation) VALUES (new.name, 'upsert');
+    END
+'''
+
+CHANGE_LOG_SCHEMA = (
+    '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key VARCHAR(50) PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS passwords_changes (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(200) NOT NULL,
+            operation VARCHAR(10) NOT NULL
+        )
+    ''',
+    # rows are identified by their unique name, ids are local to every copy of the database.
+    # changes applied from the cloud set the applying flag inside their transaction and are not logged again
+    '''
+        CREATE TRIGGER IF NOT EXISTS passwords_changes_insert AFTER INSERT ON passwords
+        WHEN NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying' AND value = 1) BEGIN
+            INSERT INTO passwords_changes (name, operation) VALUES (new.name, 'upsert');
+        END
+    ''',
+    CHANGE_LOG_UPDATE_TRIGGER,
+    '''
+        CREATE TRIGGER IF NOT EXISTS passwords_changes_delete AFTER DELETE ON passwords
+        WHEN NOT EXISTS (SELECT 1 FROM sync_state WHERE key = 'applying' AND value = 1) BEGIN
+            INSERT INTO passwords_changes (name, operation) VALUES (old.name, 'delete');
+        END
+    ''',
+)
+
+FIELDS = ('name', 'login_name', 'password', 'memo', 'url')
+COLUMNS = ', '.join(FIELDS)
+# status codes of a cloud API without delta sync, the callers fall back to whole file transfers
+UNSUPPORTED_STATUS = (404, 405, 501)
+
+
+def create_change_log(conn):
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='passwords_changes'").fetchone():
+        return
+
+    conn.execute('BEGIN')
+    try:
+        for sql in CHANGE_LOG_SCHEMA:
+            conn.execute(sql)
+        # the rows written before the log existed are changes that the cloud has not seen yet
+        conn.execute("INSERT INTO passwords_changes (name, operation) SELECT name, 'upsert' FROM passwords ORDER BY id")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class DeltaSync:
+    # keeps the cloud copy in sync by sending and applying row changes instead of the whole database file,
+    # secrets travel encrypted exactly as they are stored
+
+    def __init__(self, password_manager, url, token):
+        self.password_manager = password_manager
+        self.url = url
+        self.token = token
+
+    def upload(self):
+        response = self._push()
+        if response.status_code == 409:
+            # the cloud copy moved on since our last sync, apply its changes and send ours again
+            pulled = self.restore()
+            if pulled.status_code != 200:
+                return pulled
+            if pulled.conflicts:
+                # both sides changed these entries. the local rows are kept and nothing is sent, the 409 goes
+                # back with the names, the next upload sends the local rows over the remote ones
+                response.conflicts = pulled.conflicts
+                return response
+            response = self._push()
+        return response
+
+    def _push(self):
+        pm = self.password_manager
+        with pm._lock:
+            conn = pm.connect()
+            create_change_log(conn)
+            state = self._state(conn)
+            last_version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM passwords_changes').fetchone()[0]
+            changes = self._collect(conn, state.get('local_version', 0))
+            base_version = state.get('remote_version', 0)
+
+        instrument.count('sync.changes_sent', len(changes))
+        with instrument.timer('cloud.upload'):
+            response = pm.session.post(self.url, headers=self._headers(), json={
+                'base_version': base_version,
+                'changes': changes,
+            })
+        if response.status_code == 200:
+            with pm._lock, pm.connect() as conn:
+                self._set_state(conn, local_version=last_version, remote_version=response.json()['version'])
+                conn.execute('DELETE FROM passwords_changes WHERE version <= ?', (last_version,))
+        return response
+
+    def restore(self):
+        # migrations imports this module for the change log trigger
+        from .migrations import name_key
+
+        pm = self.password_manager
+        with pm._lock:
+            conn = pm.connect()
+            create_change_log(conn)
+            since = self._state(conn).get('remote_version', 0)
+
+        headers = self._headers()
+        headers['X-Since-Version'] = str(since)
+        with instrument.timer('cloud.restore'):
+            response = pm.session.get(self.url, headers=headers)
+        if response.status_code != 200:
+            return response
+
+        data = response.json()
+        instrument.count('sync.changes_received', len(data['changes']))
+        conflicts = []
+        with pm._lock, pm.connect() as conn:
+            # entries changed here since the last upload are not overwritten, the remote change is a conflict
+            local_version = self._state(conn).get('local_version', 0)
+            unsent = {name for name, in conn.execute(
+                'SELECT DISTINCT name FROM passwords_changes WHERE version > ?', (local_version,))}
+            conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('applying', 1)")
+            for change in data['changes']:
+                name = change['name'] if change['op'] == 'delete' else change['row']['name']
+                if name in unsent:
+                    conflicts.append(name)
+                    continue
+                if change['op'] == 'delete':
+                    conn.execute('DELETE FROM passwords WHERE name=?', (change['name'],))
+                    continue
+
+                row = change['row']
+                # the blind index of the received login names is left to backfill_login_index()
+                values = (row['login_name'], row['password'], row['memo'], row['url'], row['name'])
+                cursor = conn.execute('''
+                    UPDATE passwords SET login_name=?, password=?, memo=?, url=?, login_index=NULL WHERE name=?
+                ''', values)
+                if cursor.rowcount == 0:
+                    conn.execute('''
+                        INSERT INTO passwords (login_name, password, memo, url, name, name_lower)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', values + (name_key(row['name']),))
+            conn.execute("DELETE FROM sync_state WHERE key = 'applying'")
+            self._set_state(conn, remote_version=data['version'])
+        response.conflicts = conflicts
+        return response
+
+    def _collect(self, conn, since):
+        # the last operation of every row changed since the previous upload
+        changes = []
+        for name, operation, version in conn.execute('''
+            SELECT name, operation, MAX(version) FROM passwords_changes
+            WHERE version > ? GROUP BY name ORDER BY MAX(version)
+        ''', (since,)):
+            row = None
+            if operation == 'upsert':
+                row = conn.execute(f'SELECT {COLUMNS} FROM passwords WHERE name=?', (name,)).fetchone()
+            if row is None:
+                changes.append({'op': 'delete', 'name': name})
+            else:
+                changes.append(self._upsert(row))
+        return changes
+
+    @staticmethod
+    def _upsert(row):
+        return {'op': 'upsert', 'row': dict(zip(FIELDS, row))}
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.token}', 'X-Sync': 'delta'}
+
+    @staticmethod
+    def _state(conn):
+        return dict(conn.execute("SELECT key, value FROM sync_state WHERE key != 'applying'"))
+
+    @staticmethod
+    def _set_state(conn, **values):
+        conn.executemany('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', values.items())
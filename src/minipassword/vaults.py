@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .box import ConfUtils, PasswordManager
+
+
+class VaultSet:
+    # several vaults open at once, one PasswordManager and so one connection each. searches run on a thread
+    # per vault, sqlite releases the GIL while it executes a query
+
+    def __init__(self, names=None, conf_utils=None, max_workers=None):
+        if conf_utils is None:
+            conf_utils = ConfUtils()
+        self.conf_utils = conf_utils
+        if names is None:
+            names = conf_utils.vault_names()
+
+        self.vaults = {}
+        try:
+            for name in names:
+                vault_conf = ConfUtils(data_path=conf_utils.vault_path(name))
+                self.vaults[name] = PasswordManager(conf_utils=vault_conf)
+        except BaseException:
+            self.close()
+            raise
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(self.vaults), 1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.vaults[name]
+
+    def __iter__(self):
+        return iter(self.vaults)
+
+    def __len__(self):
+        return len(self.vaults)
+
+    def close(self):
+        for password_manager in self.vaults.values():
+            password_manager.close()
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown()
+
+    def _map(self, func):
+        # func(password_manager) on every vault at once, (name, result) in the order of the vaults
+        futures = [(name, self._executor.submit(func, pm)) for name, pm in self.vaults.items()]
+        return [(name, future.result()) for name, future in futures]
+
+    def search(self, query_string):
+        # (score, vault name, entry) of every vault. bm25 scores depend on the entries of their vault and do not
+        # compare across vaults, so the lists are merged by rank: index matches before substring matches,
+        # then the best match of every vault, the second best of every vault and so on, in the order of the vaults
+        results = []
+        for position, (name, ranked) in enumerate(self._map(lambda pm: pm.search(query_string))):
+            results.extend((score >= 0, index, position, score, name, entry)
+                           for index, (score, entry) in enumerate(ranked))
+        results.sort(key=lambda result: result[:3])
+        return [(score, name, entry) for _, _, _, score, name, entry in results]
+
+    def get_password(self, query_string):
+        return [(name, entry) for _, name, entry in self.search(query_string)]
+
+    def get_password_by_name(self, name):
+        # (vault name, entry) of every vault that has an entry with this name
+        return [(vault, entry) for vault, entry in self._map(lambda pm: pm.get_password_by_name(name))
+                if entry is not None]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class CloudServer:
+    # a local stand-in for the cloud API used by upload_db and restore_db
+
+    def __init__(self):
+        self.database = None
+        self.uploads = {}
+        # chunk index -> number of times the server answers 500 before accepting it
+        self.failures = {}
+        self.received = []
+        # delta sync, every accepted upload is one version holding its changes
+        self.delta = True
+        self.version = 0
+        self.history = []
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api'
+
+    def start(self):
+        handler = type('Handler', (CloudHandler,), {'cloud': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class CloudHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    cloud = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='application/json'):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def acknowledged(self, upload_id):
+        chunks = self.cloud.uploads.get(upload_id, {})
+        count = 0
+        while count in chunks:
+            count += 1
+        return count
+
+    def do_GET(self):
+        if self.headers.get('X-Sync') == 'delta':
+            return self.send_changes(int(self.headers.get('X-Since-Version', 0)))
+
+        upload_id = self.headers.get('X-Upload-Id')
+        if upload_id is None:
+            return self.reply(404, {'error': 'unknown upload'})
+        self.reply(200, {'acknowledged': self.acknowledged(upload_id)})
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.headers.get('X-Sync') == 'delta':
+            return self.receive_changes(json.loads(body))
+
+        upload_id = self.headers.get('X-Upload-Id')
+        if upload_id is not None:
+            return self.receive_chunk(upload_id, body)
+
+        if self.headers.get('Content-Type') == 'application/octet-stream':
+            self.cloud.database = body
+            return self.reply(200, {'message': 'uploaded'})
+
+        if self.cloud.database is None:
+            return self.reply(404, {'error': 'nothing uploaded'})
+        self.reply(200, self.cloud.database, 'application/octet-stream')
+
+    def receive_chunk(self, upload_id, body):
+        index = int(self.headers['X-Chunk-Index'])
+        if self.cloud.failures.get(index, 0) > 0:
+            self.cloud.failures[index] -= 1
+            return self.reply(500, {'error': 'try again'})
+
+        chunk = zlib.decompress(body)
+        if hashlib.sha256(chunk).hexdigest() != self.headers['X-Chunk-Sha256']:
+            return self.reply(400, {'error': 'checksum mismatch'})
+
+        self.cloud.received.append(index)
+        chunks = self.cloud.uploads.setdefault(upload_id, {})
+        chunks[index] = chunk
+        count = int(self.headers['X-Chunk-Count'])
+        if len(chunks) == count:
+            database = b''.join(chunks[i] for i in range(count))
+            if hashlib.sha256(database).hexdigest() != upload_id:
+                return self.reply(400, {'error': 'file checksum mismatch'})
+            self.cloud.database = database
+        self.reply(200, {'acknowledged': self.acknowledged(upload_id)})
+
+    def send_changes(self, since):
+        if not self.cloud.delta:
+            return self.reply(404, {'error': 'delta sync is not supported'})
+        changes = [change for version, changes in self.cloud.history if version > since for change in changes]
+        self.reply(200, {'version': self.cloud.version, 'changes': changes})
+
+    def receive_changes(self, data):
+        if not self.cloud.delta:
+            return self.reply(404, {'error': 'delta sync is not supported'})
+        if data['base_version'] != self.cloud.version:
+            return self.reply(409, {'error': 'out of date', 'version': self.cloud.version})
+        self.cloud.version += 1
+        self.cloud.history.append((self.cloud.version, data['changes']))
+        self.reply(200, {'version': self.cloud.version})
@@ -0,0 +1,125 @@
+import io
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from minipassword.agent import Agent, AgentRunningError
+from minipassword.box import PasswordManager
+from minipassword.commands import CommandHandler, parse_args
+from minipassword.script import AgentClient, ScriptError
+from tests.vault import TempVault
+
+
+class TestAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(5)
+        self.socket_path = os.path.join(self.vault.home.name, 'agent.sock')
+        self.agent = self.start_agent()
+        self.client = AgentClient.connect(self.socket_path)
+
+    def tearDown(self):
+        self.client.close()
+        self.agent.stop()
+        self.thread.join(5)
+        self.vault.cleanup()
+
+    def start_agent(self, idle_timeout=60):
+        agent = Agent(self.vault.password_manager, self.socket_path, idle_timeout=idle_timeout)
+        self.thread = threading.Thread(target=agent.run, daemon=True)
+        self.thread.start()
+        self.assertTrue(agent.ready.wait(5))
+        return agent
+
+    def test_get(self):
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'entry1', 'field': 'password'})['value'], 'secret1')
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'entry1'})['entry']['login_name'], 'user1')
+        stats = self.client.execute({'op': 'stats'})
+        self.assertEqual(stats['entries'], 5)
+        self.assertEqual((stats['cache']['size'], stats['cache']['hits'], stats['cache']['misses']), (1, 1, 1))
+
+        with self.assertRaises(ScriptError):
+            self.client.execute({'op': 'get', 'name': 'missing'})
+        with self.assertRaises(ScriptError):
+            self.client.execute({'op': 'get', 'name': 'entry1', 'field': 'unknown'})
+
+    def test_writes_update_the_index(self):
+        self.client.execute({'op': 'get', 'name': 'entry2'})
+        self.client.execute({'op': 'update', 'name': 'entry2', 'new_name': 'renamed', 'password': 'changed'})
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'renamed', 'field': 'password'})['value'], 'changed')
+        with self.assertRaises(ScriptError):
+            self.client.execute({'op': 'get', 'name': 'entry2'})
+
+        self.client.execute({'op': 'add', 'name': 'new', 'login_name': 'me', 'password': 'pw'})
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'new', 'field': 'login_name'})['value'], 'me')
+        self.client.execute({'op': 'delete', 'name': 'new'})
+        self.assertNotIn('new', self.agent.names)
+
+    def test_sees_changes_of_other_processes(self):
+        self.client.execute({'op': 'get', 'name': 'entry3'})
+        with PasswordManager(conf_utils=self.vault.conf_utils) as password_manager:
+            password_manager.update_password(4, 'entry3', 'user3', 'elsewhere')
+            password_manager.add_password('outside', 'user', 'secret')
+
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'entry3', 'field': 'password'})['value'], 'elsewhere')
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'outside', 'field': 'password'})['value'], 'secret')
+
+    def test_concurrent_clients(self):
+        errors = []
+
+        def lookups(number):
+            client = AgentClient.connect(self.socket_path)
+            try:
+                for i in range(20):
+                    value = client.execute({'op': 'get', 'name': f'entry{number}', 'field': 'password'})['value']
+                    if value != f'secret{number}':
+                        errors.append(value)
+            finally:
+                client.close()
+
+        threads = [threading.Thread(target=lookups, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_socket_is_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+        with self.assertRaises(AgentRunningError):
+            Agent(self.vault.password_manager, self.socket_path)._remove_stale_socket()
+
+    def test_idle_timeout_wipes_entries(self):
+        self.client.close()
+        self.agent.stop()
+        self.thread.join(5)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+        self.agent = self.start_agent(idle_timeout=0.2)
+        self.client = AgentClient.connect(self.socket_path)
+        self.client.execute({'op': 'get', 'name': 'entry0'})
+        self.assertIn(('name', 'entry0'), self.vault.password_manager.cache)
+        time.sleep(0.5)
+        self.assertEqual(len(self.vault.password_manager.cache), 0)
+        self.assertEqual(self.client.execute({'op': 'get', 'name': 'entry0', 'field': 'password'})['value'], 'secret0')
+
+    def test_thin_client_command(self):
+        # the command does not need a configured vault of its own when an agent is listening
+        home = tempfile.TemporaryDirectory()
+        stdout = io.StringIO()
+        with mock.patch.dict('os.environ', {'HOME': home.name, 'MINIPASSWORD_AGENT_SOCK': self.socket_path}):
+            handler = CommandHandler(parse_args(['get', 'entry4', '--field', 'password']))
+            with redirect_stdout(stdout):
+                handler.run()
+        handler.agent_client.close()
+        home.cleanup()
+        self.assertEqual(stdout.getvalue(), 'secret4\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
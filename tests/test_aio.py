@@ -0,0 +1,99 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+from minipassword import aio
+from minipassword.aio import AsyncPasswordManager
+from tests.cloudserver import CloudServer
+from tests.vault import TempVault
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncPasswordManager(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(50)
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_concurrent_lookups(self):
+        async def lookups():
+            async with AsyncPasswordManager(conf_utils=self.vault.conf_utils) as apm:
+                entries = await asyncio.gather(*(apm.get_password_by_name(f'entry{i % 50}') for i in range(200)))
+                missing = await apm.get_password_by_name('missing')
+            return entries, missing
+
+        entries, missing = run(lookups())
+        self.assertIsNone(missing)
+        self.assertEqual([entry.name for entry in entries[:3]], ['entry0', 'entry1', 'entry2'])
+        # already decrypted, reading them does not decrypt on the loop
+        self.assertEqual([entry._password for entry in entries[48:52]], ['secret48', 'secret49', 'secret0', 'secret1'])
+
+    def test_writes(self):
+        async def writes():
+            async with AsyncPasswordManager(conf_utils=self.vault.conf_utils) as apm:
+                await apm.add_password('new', 'me', 'pw', 'memo', 'https://example.com')
+                entry = await apm.get_password_by_name('new')
+                await apm.update_password(entry.id, 'renamed', 'me', 'changed')
+                renamed = await apm.get_password_by_id(entry.id)
+                result = await apm.add_passwords([('bulk', 'user', 'secret'), ('entry1', 'user', 'secret')])
+                await apm.delete_password((await apm.get_password_by_name('entry2')).id)
+                names = [entry.name async for entry in apm.iter_passwords(batch_size=7)]
+                found = await apm.get_password('renamed')
+            return renamed, result, names, found
+
+        renamed, result, names, found = run(writes())
+        self.assertEqual((renamed.name, renamed.login_name, renamed.password), ('renamed', 'me', 'changed'))
+        self.assertEqual((result.added, [name for name, reason in result.skipped]), (1, ['entry1']))
+        self.assertEqual(len(names), 51)
+        self.assertNotIn('entry2', names)
+        self.assertEqual([entry.name for entry in found], ['renamed'])
+
+
+class TestAsyncCloud(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CloudServer().start()
+        self.vault = TempVault()
+        self.vault.add_entries(20)
+        self.vault.conf_utils.set('common', 'cloud_api', self.server.url)
+        self.vault.conf_utils.set('common', 'cloud_token', 'token')
+
+    def tearDown(self):
+        self.vault.cleanup()
+        self.server.stop()
+
+    def upload_and_restore(self):
+        async def transfer():
+            async with AsyncPasswordManager(conf_utils=self.vault.conf_utils) as apm:
+                uploaded = await apm.upload_db()
+                await apm.add_password('not uploaded', 'user', 'secret')
+                restored = await apm.restore_db()
+                return uploaded, restored, await apm.get_password_by_name('not uploaded')
+
+        uploaded, restored, entry = run(transfer())
+        self.assertEqual((uploaded.status_code, restored.status_code), (200, 200))
+        self.assertEqual(uploaded.json(), {'message': 'uploaded'})
+        self.assertIsNone(entry)
+        self.assertTrue(os.path.exists(restored.backup_file))
+
+    @unittest.skipIf(aio.aiohttp is None, 'aiohttp is not installed')
+    def test_aiohttp_transfers(self):
+        self.upload_and_restore()
+
+    def test_transfers_without_aiohttp(self):
+        with mock.patch.object(aio, 'aiohttp', None):
+            self.upload_and_restore()
+
+
+if __name__ == '__main__':
+    unittest.main()
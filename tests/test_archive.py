@@ -0,0 +1,105 @@
+import os
+import stat
+import unittest
+from minipassword import archive
+from minipassword.archive import ArchiveError, ArchiveReader
+from minipassword.importer import detect_format, import_file
+from tests.vault import TempVault
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(300)
+        self.vault.password_manager.add_password('with url', 'me', 'secret', 'memo', 'https://example.com')
+        self.archive_file = f'{self.vault.home.name}/vault.mpx'
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def export(self, compression):
+        pm = self.vault.password_manager
+        # small blocks, so that the archive has a few of them
+        rows = pm.connect().execute(f'SELECT {pm.COLUMNS} FROM passwords ORDER BY id')
+        return archive.write_archive(rows, self.archive_file, compression, block_size=4096)
+
+    def check_archive(self):
+        pm = self.vault.password_manager
+        expected = [entry.as_tuple() for entry in pm.get_all_passwords()]
+        with ArchiveReader(self.archive_file) as reader:
+            self.assertEqual(len(reader), 301)
+            self.assertEqual(list(reader), expected)
+            self.assertEqual(reader.get_by_name('entry150'), pm.get_password_by_name('entry150').as_tuple())
+            self.assertEqual(reader.get(expected[-1][0]), expected[-1])
+            self.assertIsNone(reader.get_by_name('missing'))
+            self.assertIsNone(reader.get(10 ** 9))
+            self.assertEqual(len(reader.names()), 301)
+
+    def test_zlib(self):
+        self.assertEqual(self.export('zlib'), 301)
+        self.check_archive()
+
+    @unittest.skipIf(archive.zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        self.export('zstd')
+        self.check_archive()
+
+    def test_uncompressed(self):
+        self.export('none')
+        self.check_archive()
+        with self.assertRaises(ArchiveError):
+            self.export('lz4')
+
+    def test_corrupt_archive(self):
+        self.export('zlib')
+        with open(self.archive_file, 'r+b') as f:
+            f.seek(archive.ARCHIVE_HEADER.size + archive.ARCHIVE_BLOCK.size + 10)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes((byte[0] ^ 0xFF,)))
+        with ArchiveReader(self.archive_file) as reader:
+            with self.assertRaises(ArchiveError):
+                list(reader)
+
+        with open(self.archive_file, 'r+b') as f:
+            f.truncate(os.path.getsize(self.archive_file) - 4)
+        with self.assertRaises(ArchiveError):
+            ArchiveReader(self.archive_file)
+        with self.assertRaises(ArchiveError):
+            ArchiveReader(self.vault.password_manager.database_file)
+
+    def test_export_import(self):
+        self.assertEqual(self.vault.password_manager.export(self.archive_file), 301)
+        self.assertEqual(stat.S_IMODE(os.stat(self.archive_file).st_mode), 0o600)
+        self.assertEqual(detect_format(self.archive_file), 'archive')
+
+        other = TempVault(aes_key=self.vault.password_manager.aes_key)
+        try:
+            pm = other.password_manager
+            pm.add_password('entry7', 'already', 'here')
+            result = pm.import_archive(self.archive_file, names=['entry3', 'entry7', 'with url', 'missing'])
+            self.assertEqual(result.added, 2)
+            self.assertEqual([name for name, _ in result.skipped], ['missing', 'entry7'])
+            entry = pm.get_password_by_name('with url')
+            self.assertEqual((entry.login_name, entry.password, entry.memo, entry.url),
+                             ('me', 'secret', 'memo', 'https://example.com'))
+            self.assertEqual(pm.get_password_by_name('entry7').login_name, 'already')
+
+            result = import_file(pm, self.archive_file)
+            self.assertEqual(result.added, 298)
+            self.assertEqual(pm.get_password_by_name('entry299').password, 'secret299')
+        finally:
+            other.cleanup()
+
+        stranger = TempVault()
+        try:
+            with self.assertRaises(ArchiveError):
+                stranger.password_manager.import_archive(self.archive_file)
+            self.assertEqual(stranger.password_manager.get_all_passwords(), [])
+        finally:
+            stranger.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
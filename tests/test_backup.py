@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from minipassword.backup import IncrementalBackup, snapshot
+
+
+class TestIncrementalBackup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_file = os.path.join(self.tmp_dir.name, 'minipassword.db')
+        self.conn = sqlite3.connect(self.database_file)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE passwords (id INTEGER PRIMARY KEY, name TEXT)')
+        self.insert(0, 200)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def insert(self, start, stop):
+        with self.conn:
+            self.conn.executemany('INSERT INTO passwords (id, name) VALUES (?, ?)',
+                                  ((i, f'entry {i} ' * 20) for i in range(start, stop)))
+
+    def names(self, database_file):
+        conn = sqlite3.connect(database_file)
+        try:
+            return [row[0] for row in conn.execute('SELECT name FROM passwords ORDER BY id')]
+        finally:
+            conn.close()
+
+    def test_snapshot_progress(self):
+        steps = []
+        backup_file = snapshot(self.database_file, os.path.join(self.tmp_dir.name, 'copy.db'), pages=2,
+                               progress=lambda status, remaining, total: steps.append(remaining))
+        self.assertGreater(len(steps), 1)
+        self.assertEqual(self.names(backup_file), self.names(self.database_file))
+
+    def test_delta_chain_and_pruning(self):
+        backup = IncrementalBackup(self.database_file, full_every=3, keep_full=1)
+        files = [backup.backup()]
+        for i in range(4):
+            with self.conn:
+                self.conn.execute('UPDATE passwords SET name=? WHERE id=?', (f'changed {i}', i * 50))
+            self.insert(200 + i * 10, 210 + i * 10)
+            files.append(backup.backup())
+            if i == 0:
+                self.assertLess(os.path.getsize(files[1]), os.path.getsize(files[0]) / 2)
+
+        self.assertEqual([os.path.splitext(f)[1] for f in files], ['.db', '.delta', '.delta', '.db', '.delta'])
+
+        # the first chain is pruned, the second one still rebuilds the current database
+        self.assertEqual([entry['file'] for entry in backup.load_manifest()['files']], files[3:])
+        self.assertFalse(os.path.exists(files[0]))
+        target_file = backup.materialize(os.path.join(self.tmp_dir.name, 'restored.db'))
+        self.assertEqual(self.names(target_file), self.names(self.database_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from minipassword.box import PasswordManager
+from minipassword.cache import SecretCache
+from tests.vault import TempVault
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSecretCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = SecretCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats(), {'size': 2, 'max_entries': 2, 'ttl': 300, 'hits': 3, 'misses': 1, 'evictions': 1})
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = SecretCache(ttl=10, clock=clock)
+        cache.put('a', 1)
+        clock.now = 9
+        self.assertIn('a', cache)
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 10
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestPasswordManagerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(3)
+        self.cache = SecretCache()
+        self.password_manager = self.vault.password_manager
+        self.password_manager.cache = self.cache
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_hits(self):
+        first = self.password_manager.get_password_by_name('entry1')
+        second = self.password_manager.get_password_by_name('entry1')
+        self.assertIs(first, second)
+        self.assertEqual(second._password, 'secret1')
+        self.assertIsNone(self.password_manager.get_password_by_name('missing'))
+        self.assertEqual(self.password_manager.get_password_by_id(first.id).name, 'entry1')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_writes_invalidate(self):
+        entry = self.password_manager.get_password_by_name('entry1')
+        self.password_manager.update_password(entry.id, 'entry1', 'user1', 'changed')
+        self.assertEqual(self.password_manager.get_password_by_name('entry1').password, 'changed')
+
+        self.password_manager.delete_password(entry.id)
+        self.assertIsNone(self.password_manager.get_password_by_name('entry1'))
+
+        self.password_manager.add_password('entry1', 'user1', 'again')
+        self.assertEqual(self.password_manager.get_password_by_name('entry1').password, 'again')
+
+        self.password_manager.aes_key = self.password_manager.aes_key
+        self.assertEqual(len(self.cache), 0)
+
+    def test_writes_of_other_connections_invalidate(self):
+        self.assertEqual(self.password_manager.get_password_by_name('entry2').password, 'secret2')
+        with PasswordManager(conf_utils=self.vault.conf_utils) as password_manager:
+            password_manager.update_password(3, 'entry2', 'user2', 'elsewhere')
+        self.assertEqual(self.password_manager.get_password_by_name('entry2').password, 'elsewhere')
+
+
+if __name__ == '__main__':
+    unittest.main()
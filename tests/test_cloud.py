@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import unittest
+from minipassword.box import InvalidDatabaseError
+from minipassword.cloud import ChunkedUploader
+from tests.cloudserver import CloudServer
+from tests.vault import TempVault
+
+
+class TestUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CloudServer().start()
+        self.vault = TempVault()
+        self.vault.add_entries(300)
+        self.vault.conf_utils.set('common', 'cloud_api', self.server.url)
+        self.vault.conf_utils.set('common', 'cloud_token', 'token')
+        self.password_manager = self.vault.password_manager
+
+    def tearDown(self):
+        self.vault.cleanup()
+        self.server.stop()
+
+    def uploaded_names(self):
+        uploaded_file = os.path.join(self.vault.home.name, 'uploaded.db')
+        with open(uploaded_file, 'wb') as f:
+            f.write(self.server.database)
+        conn = sqlite3.connect(uploaded_file)
+        try:
+            return {row[0] for row in conn.execute('SELECT name FROM passwords')}
+        finally:
+            conn.close()
+
+    def test_whole_file_upload(self):
+        response = self.password_manager.upload_db()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.uploaded_names()), 300)
+
+    def test_chunked_upload(self):
+        progress = []
+        response = self.password_manager.upload_db(chunked=True, chunk_size=4096,
+                                                   progress=lambda sent, total: progress.append((sent, total)))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(progress[-1][0], progress[-1][1])
+        self.assertEqual(len(self.uploaded_names()), 300)
+        self.assertFalse(os.path.exists(f'{self.password_manager.database_file}.upload'))
+
+    def test_retry_and_resume(self):
+        uploader = ChunkedUploader(self.server.url, 'token', chunk_size=4096, retries=2, backoff=0)
+
+        self.server.failures = {1: 1}
+        self.server.failures[3] = 10
+        response = uploader.upload(self.password_manager.database_file)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.server.received, [0, 1, 2])
+
+        # the next run picks up the same snapshot at the first chunk the server does not have
+        self.server.failures = {}
+        response = uploader.upload(self.password_manager.database_file)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resumed_from, 3)
+        self.assertEqual(self.server.received[3], 3)
+        self.assertEqual(sorted(self.server.received), list(range(len(self.server.received))))
+
+    def test_no_resume_after_changes(self):
+        uploader = ChunkedUploader(self.server.url, 'token', chunk_size=4096, retries=0, backoff=0)
+        self.server.failures = {3: 1}
+        self.assertEqual(uploader.upload(self.password_manager.database_file).status_code, 500)
+
+        # the snapshot misses the new entry, a new one is uploaded from the start
+        self.server.failures = {}
+        self.password_manager.add_password('added later', 'user', 'secret')
+        response = uploader.upload(self.password_manager.database_file)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.resumed_from, 0)
+        self.assertIn('added later', self.uploaded_names())
+        self.assertFalse(os.path.exists(f'{self.password_manager.database_file}.upload.snapshot'))
+
+
+class TestRestore(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CloudServer().start()
+        self.vault = TempVault()
+        self.vault.add_entries(20)
+        self.vault.conf_utils.set('common', 'cloud_api', self.server.url)
+        self.vault.conf_utils.set('common', 'cloud_token', 'token')
+        self.password_manager = self.vault.password_manager
+
+    def tearDown(self):
+        self.vault.cleanup()
+        self.server.stop()
+
+    def test_restore_replaces_database(self):
+        self.password_manager.upload_db()
+        self.password_manager.add_password('not uploaded', 'user', 'secret')
+
+        response = self.password_manager.restore_db()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.password_manager.get_password_by_name('not uploaded'))
+        self.assertEqual(self.password_manager.get_password_by_name('entry5').password, 'secret5')
+        self.assertTrue(os.path.exists(response.backup_file))
+        self.assertFalse(os.path.exists(f'{self.password_manager.database_file}.restore'))
+
+    def assert_rejected(self, message):
+        with self.assertRaisesRegex(InvalidDatabaseError, message):
+            self.password_manager.restore_db()
+        self.assertEqual(len(self.password_manager.get_all_passwords()), 20)
+        self.assertFalse(os.path.exists(f'{self.password_manager.database_file}.restore'))
+
+    def test_rejects_invalid_payloads(self):
+        self.server.database = b'<html>502 Bad Gateway</html>'
+        self.assert_rejected('not a SQLite database')
+
+        other = TempVault()
+        try:
+            other.add_entries(1)
+            other.password_manager.close()
+            with open(other.password_manager.database_file, 'rb') as f:
+                self.server.database = f.read()
+        finally:
+            other.cleanup()
+        self.assert_rejected('AES key')
+
+        self.password_manager.upload_db()
+        self.server.database = self.server.database[:len(self.server.database) // 2]
+        self.assert_rejected('database')
+
+
+class TestDeltaSync(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CloudServer().start()
+        self.vaults = [TempVault()]
+        self.vaults.append(TempVault(aes_key=self.vaults[0].password_manager.aes_key))
+        for vault in self.vaults:
+            vault.conf_utils.set('common', 'cloud_api', self.server.url)
+            vault.conf_utils.set('common', 'cloud_token', 'token')
+        self.first, self.second = (vault.password_manager for vault in self.vaults)
+        self.vaults[0].add_entries(50)
+
+    def tearDown(self):
+        for vault in self.vaults:
+            vault.cleanup()
+        self.server.stop()
+
+    def test_only_changes_are_sent(self):
+        self.assertEqual(self.first.upload_db(delta=True).status_code, 200)
+        self.assertEqual(self.second.restore_db(delta=True).status_code, 200)
+        self.assertEqual(self.second.get_password_by_name('entry7').password, 'secret7')
+
+        entry = self.first.get_password_by_name('entry3')
+        self.first.update_password(entry.id, 'renamed', 'user3', 'new secret')
+        self.first.delete_password(self.first.get_password_by_name('entry4').id)
+        self.first.upload_db(delta=True)
+        self.assertEqual(len(self.server.history[-1][1]), 3)
+
+        self.second.restore_db(delta=True)
+        self.assertEqual(self.second.get_password_by_name('renamed').password, 'new secret')
+        self.assertIsNone(self.second.get_password_by_name('entry4'))
+        self.assertEqual(len(self.second.get_all_passwords()), 49)
+
+        # applied changes are not sent back, the next upload holds only the new entry
+        self.second.add_password('from second', 'user', 'secret')
+        self.assertEqual(self.second.upload_db(delta=True).status_code, 200)
+        self.assertEqual([change['row']['name'] for change in self.server.history[-1][1]], ['from second'])
+
+    def test_out_of_date_upload_pulls_first(self):
+        self.first.upload_db(delta=True)
+        self.second.add_password('from second', 'user', 'secret')
+        self.assertEqual(self.second.upload_db(delta=True).status_code, 200)
+        self.assertIsNotNone(self.second.get_password_by_name('entry0'))
+        self.assertEqual(self.server.version, 2)
+
+        self.first.restore_db(delta=True)
+        self.assertEqual(len(self.first.get_all_passwords()), 51)
+        self.assertEqual(self.first.get_password_by_name('from second').password, 'secret')
+
+    def test_same_entry_conflict(self):
+        self.first.upload_db(delta=True)
+        self.second.restore_db(delta=True)
+        for password_manager, password in ((self.first, 'A-edit'), (self.second, 'B-edit')):
+            entry = password_manager.get_password_by_name('entry1')
+            password_manager.update_password(entry.id, 'entry1', 'user1', password)
+        self.first.add_password('from first', 'user', 'secret')
+        self.assertEqual(self.first.upload_db(delta=True).status_code, 200)
+
+        # the edit of the second copy is neither overwritten nor sent without notice
+        response = self.second.upload_db(delta=True)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.conflicts, ['entry1'])
+        self.assertEqual(self.second.get_password_by_name('entry1').password, 'B-edit')
+        self.assertEqual(self.second.get_password_by_name('from first').password, 'secret')
+        self.assertEqual(self.server.version, 2)
+
+        # uploading again sends the kept local version
+        self.assertEqual(self.second.upload_db(delta=True).status_code, 200)
+        self.assertEqual(self.first.restore_db(delta=True).conflicts, [])
+        self.assertEqual(self.first.get_password_by_name('entry1').password, 'B-edit')
+
+        # a restore keeps entries that are not uploaded yet as well
+        entry = self.first.get_password_by_name('entry2')
+        self.first.update_password(entry.id, 'entry2', 'user2', 'A-edit')
+        entry = self.second.get_password_by_name('entry2')
+        self.second.update_password(entry.id, 'entry2', 'user2', 'B-edit')
+        self.second.upload_db(delta=True)
+        self.assertEqual(self.first.restore_db(delta=True).conflicts, ['entry2'])
+        self.assertEqual(self.first.get_password_by_name('entry2').password, 'A-edit')
+
+    def test_falls_back_to_whole_file(self):
+        self.server.delta = False
+        self.assertEqual(self.first.upload_db(delta=True).status_code, 200)
+        self.assertIsNotNone(self.server.database)
+        self.assertEqual(self.server.history, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import os
+import stat
+import tempfile
+import time
 import unittest
+from minipassword import instrument
 from minipassword.box import ConfUtils
 
 
@@ -17,5 +21,60 @@ class TestConfig(unittest.TestCase):
             self.assertTrue(False)
 
 
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.data_path = f'{self.home.name}/.minipassword'
+        self.util = ConfUtils(data_path=self.data_path)
+
+    def tearDown(self):
+        instrument.disable()
+        self.home.cleanup()
+
+    def test_reads_once(self):
+        self.util.set('common', 'aes_key', 'key')
+        instrumentation = instrument.enable()
+        for _ in range(10):
+            self.assertEqual(self.util.get('common', 'aes_key'), 'key')
+        self.assertNotIn('config.read', instrumentation.timers)
+
+    def test_batch_writes_once(self):
+        instrumentation = instrument.enable()
+        with self.util.batch():
+            self.util.set('common', 'cloud_api', 'http://localhost/api')
+            self.util.set('common', 'cloud_token', 'token')
+            self.util.create_database_file()
+            self.assertFalse(ConfUtils(data_path=self.data_path).config.has_option('common', 'cloud_token'))
+        self.assertEqual(instrumentation.timers['config.write'][0], 1)
+
+        other = ConfUtils(data_path=self.data_path)
+        self.assertEqual(other.get('common', 'cloud_token'), 'token')
+        self.assertEqual(other.get('db', 'database_file'), self.util.database_file)
+        self.assertEqual(stat.S_IMODE(os.stat(self.util.config_file).st_mode), 0o600)
+
+    def test_batch_rolls_back(self):
+        self.util.set('common', 'aes_key', 'old')
+        with self.assertRaises(ValueError):
+            with self.util.batch():
+                self.util.set('common', 'aes_key', 'new')
+                self.util.set('common', 'retired_keys', 'old')
+                raise ValueError('interrupted')
+        self.assertEqual(self.util.get('common', 'aes_key'), 'old')
+        self.assertFalse(self.util.config.has_option('common', 'retired_keys'))
+        self.assertFalse(ConfUtils(data_path=self.data_path).config.has_option('common', 'retired_keys'))
+
+    def test_external_change(self):
+        self.util.set('common', 'aes_key', 'old')
+        other = ConfUtils(data_path=self.data_path)
+        # the size alone tells the files apart, the mtime may not have moved
+        other.set('common', 'aes_key', 'newer')
+        self.assertEqual(self.util.get('common', 'aes_key'), 'newer')
+        self.assertFalse(self.util.refresh())
+
+        os.utime(self.util.config_file, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        self.assertTrue(self.util.refresh())
+
+
 if __name__ == '__main__':
     unittest.main()
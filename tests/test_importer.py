@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from minipassword import importer
+from tests.vault import TempVault
+
+
+class TestImporter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.vault = TempVault()
+        self.prefix = f'import-{uuid.uuid4().hex[:8]}'
+        self.records = [
+            {'name': f'{self.prefix}-{i}', 'login_name': f'user{i}', 'password': f'secret{i}', 'memo': 'memo',
+             'url': None}
+            for i in range(5)
+        ]
+
+    def tearDown(self):
+        self.vault.cleanup()
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, content):
+        file_path = os.path.join(self.tmp_dir.name, file_name)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return file_path
+
+    def test_iter_json_small_reads(self):
+        file_path = self.write('vault.json', json.dumps(self.records, indent=2))
+        read_size = importer.READ_SIZE
+        importer.READ_SIZE = 7
+        try:
+            self.assertEqual(list(importer.iter_records(file_path)), self.records)
+        finally:
+            importer.READ_SIZE = read_size
+
+    def test_iter_jsonl_and_csv(self):
+        jsonl_path = self.write('vault.jsonl', '\n'.join(json.dumps(r) for r in self.records))
+        self.assertEqual(list(importer.iter_records(jsonl_path)), self.records)
+
+        csv_path = self.write('vault.csv', 'name,login_name,password\nGoogle,me,secret\n')
+        self.assertEqual(list(importer.iter_records(csv_path)),
+                         [{'name': 'Google', 'login_name': 'me', 'password': 'secret'}])
+
+    def test_add_passwords_skips_duplicates(self):
+        password_manager = self.vault.password_manager
+        records = self.records + [self.records[0], {'name': f'{self.prefix}-x'}]
+        result = password_manager.add_passwords(records, batch_size=3)
+        self.assertEqual(result.added, 5)
+        self.assertEqual(result.processed, 7)
+        self.assertEqual([name for name, reason in result.skipped],
+                         [f'{self.prefix}-0', f'{self.prefix}-x'])
+
+        row = password_manager.get_password_by_name(f'{self.prefix}-3')
+        self.assertEqual(password_manager.aes_decrypt(row[3]), 'secret3')
+
+    def test_import_numbers_and_empty_cells(self):
+        file_path = self.write('vault.json', json.dumps([
+            {'name': f'{self.prefix}-pin', 'login_name': 4711, 'password': 12345, 'memo': 1.5, 'url': None},
+            {'name': f'{self.prefix}-list', 'login_name': 'me', 'password': ['secret']},
+            [f'{self.prefix}-row', 'me', 'secret'],
+            3,
+        ]))
+        password_manager = self.vault.password_manager
+        result = importer.import_file(password_manager, file_path)
+        self.assertEqual(result.added, 2)
+        self.assertEqual(result.skipped, [(f'{self.prefix}-list', 'password is not a string'),
+                                          (None, 'the record is not an object')])
+        row = password_manager.get_password_by_name(f'{self.prefix}-pin')
+        self.assertEqual(password_manager.aes_decrypt(row[2]), '4711')
+        self.assertEqual(password_manager.aes_decrypt(row[3]), '12345')
+        self.assertEqual(row[4], '1.5')
+
+        csv_path = self.write('vault.csv', f'name,login_name,password,memo,url\n{self.prefix}-csv,me,secret,,\n')
+        importer.import_file(password_manager, csv_path)
+        row = password_manager.get_password_by_name(f'{self.prefix}-csv')
+        self.assertIsNone(row[4])
+        self.assertIsNone(row[5])
+
+    def test_import_file_resumes_from_checkpoint(self):
+        file_path = self.write('vault.json', json.dumps(self.records))
+        checkpoint_file = os.path.join(self.tmp_dir.name, 'import.checkpoint')
+        importer.ImportCheckpoint(checkpoint_file, file_path).save(3)
+
+        password_manager = self.vault.password_manager
+        result = importer.import_file(password_manager, file_path, checkpoint_file=checkpoint_file)
+        self.assertEqual(result.resumed_from, 3)
+        self.assertEqual(result.added, 2)
+        self.assertIsNone(password_manager.get_password_by_name(f'{self.prefix}-0'))
+        self.assertIsNotNone(password_manager.get_password_by_name(f'{self.prefix}-4'))
+        self.assertFalse(os.path.exists(checkpoint_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
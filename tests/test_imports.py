@@ -0,0 +1,35 @@
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ('requests', 'simple_term_menu', 'cryptography', 'urllib3', 'concurrent.futures.process')
+
+
+def imported_modules(statement):
+    # module names reported by python -X importtime, in import order
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            if name != 'imported package':
+                modules.append(name)
+    return modules
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_command_start_up_skips_heavy_modules(self):
+        modules = imported_modules('import minipassword.commands; minipassword.commands.build_parser()')
+        self.assertIn('minipassword.box', modules)
+        for heavy in HEAVY_MODULES:
+            self.assertFalse([m for m in modules if m == heavy or m.startswith(f'{heavy}.')],
+                             f'{heavy} is imported when the command starts')
+
+    def test_import_does_not_parse_arguments(self):
+        subprocess.run([sys.executable, '-c', 'import minipassword.commands', '--unknown-option'], check=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+from minipassword import instrument
+from minipassword.commands import CommandHandler, parse_args
+from tests.vault import TempVault
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(5)
+
+    def tearDown(self):
+        instrument.disable()
+        self.vault.cleanup()
+
+    def test_disabled_records_nothing(self):
+        self.assertIsNone(instrument.active())
+        self.assertIs(instrument.timer('sqlite.query'), instrument.NULL_TIMER)
+        self.vault.password_manager.get_password_by_name('entry1').password
+
+    def test_timers_counters_and_hooks(self):
+        events = []
+        instrumentation = instrument.enable()
+        instrumentation.add_hook(lambda kind, name, value: events.append((kind, name)))
+
+        pm = self.vault.password_manager
+        self.assertEqual(pm.get_password_by_name('entry1').password, 'secret1')
+        pm.get_all_passwords()
+        pm.add_password('new', 'user', 'secret')
+
+        data = instrumentation.as_dict()
+        self.assertEqual(data['timers']['sqlite.query']['calls'], 2)
+        self.assertEqual(data['timers']['crypto.decrypt']['calls'], 1)
+        self.assertEqual(data['timers']['crypto.encrypt']['calls'], 2)
+        self.assertEqual(data['timers']['sqlite.write']['calls'], 1)
+        self.assertEqual(data['counters']['sqlite.rows'], 6)
+        self.assertIn(('count', 'sqlite.rows'), events)
+        self.assertIn(('timer', 'crypto.decrypt'), events)
+        self.assertIn('crypto.decrypt', instrumentation.report())
+
+        self.assertIs(instrument.disable(), instrumentation)
+        pm.get_password_by_name('entry2')
+        self.assertEqual(instrumentation.timers['sqlite.query'][0], 2)
+
+    def test_profile_flag(self):
+        profile_output = os.path.join(self.vault.home.name, 'mm.prof')
+        environ = {'HOME': self.vault.home.name, 'MINIPASSWORD_AGENT_SOCK': os.path.join(self.vault.home.name, 'none')}
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch.dict('os.environ', environ), redirect_stdout(stdout), redirect_stderr(stderr):
+            args = parse_args(['--profile', '--profile-output', profile_output, 'get', 'entry3', '--field', 'password'])
+            CommandHandler(args).run()
+
+        self.assertEqual(stdout.getvalue(), 'secret3\n')
+        for name in ('command', 'config.read', 'sqlite.connect', 'sqlite.query', 'crypto.decrypt'):
+            self.assertIn(name, stderr.getvalue())
+        self.assertTrue(os.path.getsize(profile_output) > 0)
+        self.assertIsNone(instrument.active())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from minipassword.aio import AsyncPasswordManager
+from minipassword.box import ConfUtils
+from minipassword.commands import CommandHandler, parse_args
+from minipassword.login_index import LoginIndex, generate_key
+from minipassword.secret import SecretBuffer
+from tests.vault import TempVault
+
+
+class TestLoginIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.password_manager = self.vault.password_manager
+        self.password_manager.add_passwords([
+            ('github', 'Me@Example.com', 'secret'),
+            ('gitlab', 'me@example.com ', 'secret'),
+            ('google', 'other@example.com', 'secret'),
+        ])
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def names(self, login_name):
+        return [entry.name for entry in self.password_manager.get_passwords_by_login(login_name)]
+
+    def indexed(self):
+        conn = self.password_manager.connect()
+        return dict(conn.execute('SELECT name, login_index IS NOT NULL FROM passwords'))
+
+    def test_digest(self):
+        index = LoginIndex(generate_key())
+        self.assertEqual(index.digest('ME@example.com'), index.digest(' me@example.com'))
+        self.assertNotEqual(index.digest('me@example.com'), index.digest('you@example.com'))
+        self.assertNotEqual(index.digest('me@example.com'), LoginIndex(generate_key()).digest('me@example.com'))
+        low, high = index.key_range
+        self.assertTrue(low < index.digest('me@example.com') < high)
+
+    def test_digest_of_secret_buffer(self):
+        index = LoginIndex(generate_key())
+        for login_name in (' Me@Example.COM\x1f', 'ÜBER@example.com', ''):
+            secret = SecretBuffer.from_str(login_name)
+            self.assertEqual(index.digest(secret.view), index.digest(login_name))
+
+        # an ASCII login name is hashed without a str copy of it
+        self.password_manager.enable_login_index()
+        with mock.patch.object(SecretBuffer, 'decode', side_effect=AssertionError):
+            self.password_manager.add_password('gitea', SecretBuffer.from_str('ME@example.com'), 'secret')
+        conn = self.password_manager.connect()
+        self.assertEqual(conn.execute("SELECT login_index FROM passwords WHERE name = 'gitea'").fetchone()[0],
+                         self.password_manager.login_index.digest('me@example.com'))
+
+    def test_without_index(self):
+        # every login name is decrypted
+        self.assertIsNone(self.password_manager.login_index)
+        self.assertEqual(self.names('ME@EXAMPLE.COM'), ['github', 'gitlab'])
+        with self.assertRaises(ValueError):
+            self.password_manager.backfill_login_index()
+
+    def test_backfill_and_writes(self):
+        self.password_manager.enable_login_index()
+        self.assertEqual(self.names('me@example.com'), ['github', 'gitlab'])
+        self.assertEqual(self.password_manager.backfill_login_index(batch_size=2), 3)
+        self.assertEqual(self.indexed(), {'github': 1, 'gitlab': 1, 'google': 1})
+        self.assertEqual(self.password_manager.backfill_login_index(), 0)
+
+        self.password_manager.add_password('gitea', SecretBuffer.from_str('me@example.com'), 'secret')
+        self.password_manager.update_password(3, 'google', 'me@example.com', 'secret')
+        self.assertEqual(self.indexed()['gitea'], 1)
+        self.assertEqual(self.names('me@example.com'), ['github', 'gitlab', 'google', 'gitea'])
+        self.assertEqual(self.names('other@example.com'), [])
+
+        # a writer that changes a login name without the index leaves a stale value behind
+        with self.password_manager.connect() as conn:
+            conn.execute('UPDATE passwords SET login_name = ? WHERE name = ?',
+                         (self.password_manager.aes_encrypt('third@example.com'), 'github'))
+        self.assertEqual(self.names('me@example.com'), ['gitlab', 'google', 'gitea'])
+
+    def test_foreign_key_values(self):
+        # the index values of another key, e.g. from a restored database, count as not indexed
+        self.password_manager.enable_login_index()
+        self.password_manager.backfill_login_index()
+        self.password_manager.conf_utils.set('common', 'login_index_key', generate_key())
+        self.password_manager._load_keys()
+
+        self.assertEqual(self.names('me@example.com'), ['github', 'gitlab'])
+        self.assertEqual(self.password_manager.backfill_login_index(), 3)
+        self.assertEqual(self.names('other@example.com'), ['google'])
+
+        self.password_manager.disable_login_index()
+        self.assertIsNone(self.password_manager.login_index)
+        self.assertEqual(self.indexed(), {'github': 0, 'gitlab': 0, 'google': 0})
+        self.assertEqual(self.names('me@example.com'), ['github', 'gitlab'])
+
+    def test_async(self):
+        self.password_manager.enable_login_index()
+
+        async def run():
+            async with AsyncPasswordManager(password_manager=self.password_manager) as apm:
+                self.assertEqual(await apm.backfill_login_index(), 3)
+                await apm.add_password('gitea', 'me@example.com', 'secret')
+                return [entry.name for entry in await apm.get_passwords_by_login('me@example.com')]
+
+        self.assertEqual(asyncio.run(run()), ['github', 'gitlab', 'gitea'])
+        self.assertEqual(self.indexed()['gitea'], 1)
+
+    def test_command(self):
+        aes_key = self.password_manager.aes_key
+        stdout = io.StringIO()
+        # the command only indexes, it asks nothing
+        with mock.patch.dict('os.environ', {'HOME': self.vault.home.name}), \
+                mock.patch('builtins.input', side_effect=AssertionError('unexpected prompt')), redirect_stdout(stdout):
+            handler = CommandHandler(parse_args(['--index-logins']))
+            handler.run()
+        handler.password_manager.close()
+
+        self.assertIn('3 entries were added to the index', stdout.getvalue())
+        self.assertEqual(self.indexed(), {'github': 1, 'gitlab': 1, 'google': 1})
+        self.assertEqual(ConfUtils(data_path=self.vault.conf_utils.data_path).get('common', 'aes_key'), aes_key)
+
+
+if __name__ == '__main__':
+    unittest.main()
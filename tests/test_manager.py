@@ -2,6 +2,7 @@ import os
 import random
 import unittest
 from minipassword.box import PasswordManager
+from tests.vault import TempVault
 
 
 class TestPasswordManager(unittest.TestCase):
@@ -50,5 +51,89 @@ class TestPasswordManager(unittest.TestCase):
             self.assertTrue(False)
 
 
+class TestPasswordEntry(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_lazy_decryption(self):
+        password_manager = self.vault.password_manager
+        name = 'entry'
+        password_manager.add_password(name, 'login', 'secret', 'memo')
+        entry = password_manager.get_password_by_name(name)
+        self.assertIsNone(entry._password)
+        self.assertEqual(entry.password, 'secret')
+        self.assertEqual(entry.login_name, 'login')
+        self.assertEqual(entry[3], entry.encrypted_password)
+        self.assertEqual(tuple(entry)[:2], (entry.id, name))
+        self.assertNotIn('secret', repr(entry))
+
+
+class TestConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(3)
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_connection_reused(self):
+        with PasswordManager(conf_utils=self.vault.conf_utils) as password_manager:
+            conn = password_manager.connect()
+            password_manager.get_all_passwords()
+            self.assertIs(conn, password_manager.connect())
+        self.assertIsNone(password_manager._conn)
+
+    def test_wal_journal_mode(self):
+        mode = self.vault.password_manager.connect().execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_reconnect_after_file_swap(self):
+        password_manager = self.vault.password_manager
+        conn = password_manager.connect()
+        backup_file = password_manager.backup_db()
+        os.replace(backup_file, password_manager.database_file)
+        self.assertIsNot(conn, password_manager.connect())
+        self.assertEqual(len(password_manager.get_all_passwords()), 3)
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.token = f'zq{random.randint(100000, 999999)}'
+        self.vault = TempVault()
+        self.vault.add_entries(3)
+        self.password_manager = self.vault.password_manager
+        self.password_manager.add_password(f'{self.token} mail', 'login', 'secret', memo=f'{self.token} {self.token}')
+        self.password_manager.add_password(f'{self.token}bank', 'login', 'secret')
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_prefix_match_ranked(self):
+        result = self.password_manager.get_password(self.token)
+        self.assertEqual([password[1] for password in result], [f'{self.token} mail', f'{self.token}bank'])
+
+    def test_substring_falls_back_to_like(self):
+        result = self.password_manager.get_password(self.token[2:])
+        self.assertEqual(len(result), 2)
+
+    def test_iter_passwords_pages(self):
+        result = list(self.password_manager.iter_passwords(self.token, batch_size=1))
+        self.assertEqual([password[1] for password in result], [f'{self.token} mail', f'{self.token}bank'])
+        all_ids = [password.id for password in self.password_manager.iter_passwords(batch_size=2)]
+        self.assertEqual(all_ids, sorted(all_ids))
+        self.assertEqual(len(all_ids), len(self.password_manager.get_all_passwords()))
+
+    def test_without_search_index(self):
+        with PasswordManager(conf_utils=self.vault.conf_utils, search_index=False) as password_manager:
+            result = password_manager.get_password(f'{self.token}b')
+            self.assertEqual([password[1] for password in result], [f'{self.token}bank'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import unittest
+from minipassword.box import PasswordManager
+from minipassword.migrations import SCHEMA_VERSION, migrate, schema_version
+from minipassword.sync import create_change_log
+from tests.vault import TempVault
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(3)
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def legacy_database(self):
+        # the schema of the releases before the migrations, with a change log for delta sync
+        database_file = os.path.join(self.vault.home.name, 'legacy.db')
+        conn = sqlite3.connect(database_file)
+        conn.execute('''
+            CREATE TABLE passwords (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name VARCHAR(200) NOT NULL UNIQUE,
+                login_name TEXT NOT NULL,
+                password TEXT NOT NULL,
+                memo TEXT NULL,
+                url VARCHAR(255) NULL
+            )
+        ''')
+        pm = self.vault.password_manager
+        conn.executemany('INSERT INTO passwords (name, login_name, password, url) VALUES (?, ?, ?, ?)', [
+            (name, pm.aes_encrypt('user'), pm.aes_encrypt('secret'), url)
+            for name, url in (('GitHub', 'https://github.com/login'), ('gitlab', 'https://gitlab.com'), ('Google', None),
+                              ('Über Bank', None))
+        ])
+        conn.commit()
+        create_change_log(conn)
+        conn.execute('DELETE FROM passwords_changes')
+        conn.commit()
+        conn.close()
+        self.vault.conf_utils.set('db', 'database_file', database_file)
+        return database_file
+
+    def test_new_database_is_current(self):
+        conn = self.vault.password_manager.connect()
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+        self.assertEqual(migrate(conn), SCHEMA_VERSION)
+
+    def test_upgrades_legacy_database(self):
+        database_file = self.legacy_database()
+        with PasswordManager(conf_utils=self.vault.conf_utils) as password_manager:
+            conn = password_manager.connect()
+            self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+            self.assertEqual([row[0] for row in conn.execute('SELECT name_lower FROM passwords ORDER BY id')],
+                             ['github', 'gitlab', 'google', 'über bank'])
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(passwords)')]
+            self.assertIn('login_index', columns)
+            # the backfill is not a change for delta sync
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM passwords_changes').fetchone()[0], 0)
+
+            self.assertEqual([entry.name for entry in password_manager.get_passwords_by_prefix('GIT')], ['GitHub', 'gitlab'])
+            self.assertEqual([entry.name for entry in password_manager.get_passwords_by_prefix('g', limit=1)], ['GitHub'])
+            self.assertEqual([entry.name for entry in password_manager.get_passwords_by_url('https://github.com')], ['GitHub'])
+
+            password_manager.add_password('GitHub Enterprise', 'user', 'secret')
+            password_manager.update_password(3, 'GOOGLE', 'user', 'secret')
+            self.assertEqual(len(password_manager.get_passwords_by_prefix('github')), 2)
+            self.assertEqual(password_manager.get_passwords_by_prefix('goo')[0].name, 'GOOGLE')
+
+        # writers that do not know the column are covered by the triggers, a plain connection can write
+        conn = sqlite3.connect(database_file)
+        conn.execute("INSERT INTO passwords (name, login_name, password) VALUES ('Old Writer', 'x', 'y')")
+        conn.execute("UPDATE passwords SET name = 'STRASSE' WHERE name = 'gitlab'")
+        conn.execute("UPDATE passwords SET memo = 'note' WHERE name = 'Über Bank'")
+        conn.commit()
+        self.assertEqual(dict(conn.execute('''
+            SELECT name, name_lower FROM passwords WHERE name IN ('Old Writer', 'STRASSE', 'Über Bank')
+        ''')), {'Old Writer': 'old writer', 'STRASSE': 'strasse', 'Über Bank': 'über bank'})
+        conn.close()
+
+    def test_non_ascii_prefix(self):
+        password_manager = self.vault.password_manager
+        password_manager.add_password('Über Bank', 'user', 'secret')
+        password_manager.add_password('Straße', 'user', 'secret')
+        password_manager.add_password('ÅLAND', 'user', 'secret')
+        entry = password_manager.get_password_by_name('ÅLAND')
+        password_manager.update_password(entry.id, 'Åland Post', 'user', 'secret')
+        entry = password_manager.get_password_by_name('Über Bank')
+        password_manager.update_password(entry.id, 'ÜBER BANK', 'user', 'secret')
+
+        for prefix in ('Über', 'über', 'ÜBER B'):
+            self.assertEqual([entry.name for entry in password_manager.get_passwords_by_prefix(prefix)], ['ÜBER BANK'])
+        self.assertEqual([entry.name for entry in password_manager.get_passwords_by_prefix('STRASS')], ['Straße'])
+        self.assertEqual([entry.name for entry in password_manager.get_passwords_by_prefix('åland')], ['Åland Post'])
+
+    def test_failed_migration_rolls_back(self):
+        conn = sqlite3.connect(os.path.join(self.vault.home.name, 'broken.db'))
+        conn.execute('CREATE TABLE passwords (id INTEGER PRIMARY KEY, name TEXT, name_lower TEXT)')
+        conn.execute('PRAGMA user_version = 2')
+        with self.assertRaises(sqlite3.OperationalError):
+            migrate(conn)
+        self.assertEqual(schema_version(conn), 2)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from cryptography.fernet import Fernet
+from minipassword.box import ConfUtils, PasswordManager
+from minipassword.commands import CommandHandler, parse_args
+from tests.vault import TempVault
+
+
+class TestRotateKey(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(25)
+        self.conf_utils = self.vault.conf_utils
+        self.password_manager = self.vault.password_manager
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def assert_readable(self, password_manager):
+        for password in password_manager.get_all_passwords():
+            number = password[1][len('entry'):]
+            self.assertEqual(password_manager.aes_decrypt(password[2]), f'user{number}')
+            self.assertEqual(password_manager.aes_decrypt(password[3]), f'secret{number}')
+
+    def test_rotate_key(self):
+        old_key = self.password_manager.aes_key
+        progress = []
+        new_key = self.password_manager.rotate_key(chunk_size=10, processes=2,
+                                                   progress=lambda *args: progress.append(args))
+
+        self.assertNotEqual(new_key, old_key)
+        self.assertEqual([rotated for rotated, total, rate in progress], [10, 20, 25])
+        self.assertEqual(self.conf_utils.get('common', 'aes_key'), new_key)
+        self.assertEqual(self.conf_utils.get('common', 'retired_keys'), '')
+        self.assert_readable(self.password_manager)
+
+        with self.assertRaises(Exception):
+            Fernet(old_key.encode()).decrypt(self.password_manager.get_password_by_name('entry1')[3].encode())
+
+    def test_reads_with_retired_key(self):
+        # a rotation that stopped half way leaves rows encrypted with both keys
+        old_key = self.password_manager.aes_key
+        self.conf_utils.set('common', 'retired_keys', old_key)
+        self.conf_utils.set('common', 'aes_key', Fernet.generate_key().decode())
+
+        with PasswordManager(conf_utils=self.conf_utils) as password_manager:
+            password_manager.update_password(1, 'entry0', 'user0', 'secret0')
+            self.assert_readable(password_manager)
+
+    def test_writer_opened_before_rotation(self):
+        # another process still holding the old key writes with the new one once the rotation is done
+        other_conf = ConfUtils(data_path=self.conf_utils.data_path)
+        with PasswordManager(conf_utils=other_conf) as other, \
+                PasswordManager(conf_utils=self.conf_utils) as shared:
+            self.password_manager.rotate_key()
+            other.add_password('entry100', 'user100', 'secret100')
+            other.update_password(1, 'entry0', 'user0', 'secret0')
+            other.add_passwords([('entry101', 'user101', 'secret101')])
+            shared.add_password('entry102', 'user102', 'secret102')
+
+        with PasswordManager(conf_utils=ConfUtils(data_path=self.conf_utils.data_path)) as password_manager:
+            self.assertEqual(password_manager.retired_keys, [])
+            self.assert_readable(password_manager)
+            self.assertEqual(len(password_manager.get_all_passwords()), 28)
+
+    def test_command(self):
+        old_key = self.password_manager.aes_key
+        with mock.patch.dict('os.environ', {'HOME': self.vault.home.name}), \
+                mock.patch('builtins.input', return_value='Y'), redirect_stdout(io.StringIO()):
+            handler = CommandHandler(parse_args(['-k']))
+            handler.run()
+        handler.password_manager.close()
+
+        new_key = ConfUtils(data_path=self.conf_utils.data_path).get('common', 'aes_key')
+        self.assertNotEqual(new_key, old_key)
+        with PasswordManager(conf_utils=ConfUtils(data_path=self.conf_utils.data_path)) as password_manager:
+            self.assertEqual(password_manager.aes_key, new_key)
+            self.assert_readable(password_manager)
+
+
+if __name__ == '__main__':
+    unittest.main()
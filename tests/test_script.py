@@ -0,0 +1,73 @@
+import io
+import json
+import unittest
+from minipassword.commands import parse_args
+from minipassword.script import ScriptHandler
+from tests.vault import TempVault
+
+
+class TestScriptHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.vault.add_entries(3)
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def run_command(self, argv, stdin=''):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        handler = ScriptHandler(self.vault.password_manager, parse_args(argv), stdin=io.StringIO(stdin),
+                                stdout=stdout, stderr=stderr)
+        return handler.run(), stdout.getvalue(), stderr.getvalue()
+
+    def test_interactive_mode_has_no_command(self):
+        self.assertIsNone(parse_args([]).command)
+        self.assertTrue(parse_args(['-l']).list_file)
+
+    def test_get_field(self):
+        self.assertEqual(self.run_command(['get', 'entry1', '--field', 'password']), (0, 'secret1\n', ''))
+
+        code, stdout, stderr = self.run_command(['get', 'entry2', '--json'])
+        self.assertEqual(json.loads(stdout)['entry']['login_name'], 'user2')
+
+        code, stdout, stderr = self.run_command(['get', 'missing', '--field', 'password'])
+        self.assertEqual((code, stdout), (1, ''))
+        self.assertIn('missing', stderr)
+
+    def test_add_update_delete(self):
+        self.assertEqual(self.run_command(['add', 'new', '--login-name', 'me', '--password-stdin'], 's3cret\n')[0], 0)
+        self.assertEqual(self.run_command(['get', 'new', '--field', 'password'])[1], 's3cret\n')
+
+        self.run_command(['update', 'new', '--new-name', 'renamed', '--url', 'https://example.com'])
+        entry = self.vault.password_manager.get_password_by_name('renamed')
+        self.assertEqual((entry.login_name, entry.password, entry.url), ('me', 's3cret', 'https://example.com'))
+
+        code, stdout, stderr = self.run_command(['add', 'renamed', '--login-name', 'me', '--password', 'x', '--json'])
+        self.assertEqual((code, json.loads(stdout)['ok']), (1, False))
+
+        self.assertEqual(self.run_command(['delete', 'renamed'])[0], 0)
+        self.assertIsNone(self.vault.password_manager.get_password_by_name('renamed'))
+
+    def test_batch(self):
+        requests = [
+            {'op': 'get', 'name': 'entry0', 'field': 'password'},
+            {'op': 'get', 'name': 'missing'},
+            {'op': 'add', 'name': 'batch', 'login_name': 'me', 'password': 'pw'},
+        ]
+        code, stdout, stderr = self.run_command(['batch'], '\n'.join(json.dumps(r) for r in requests) + '\nnot json\n')
+        results = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual(code, 1)
+        self.assertEqual(results[0]['value'], 'secret0')
+        self.assertEqual([result['ok'] for result in results], [True, False, True, False])
+
+    def test_batch_request_not_an_object(self):
+        code, stdout, stderr = self.run_command(['batch'], '[1]\n"x"\n3\n{"op": "get", "name": "entry0"}\n')
+        results = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual(code, 1)
+        self.assertEqual([result['ok'] for result in results], [False, False, False, True])
+        self.assertEqual(results[0]['error'], 'a request is a JSON object')
+
+
+if __name__ == '__main__':
+    unittest.main()
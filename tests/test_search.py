@@ -0,0 +1,47 @@
+import unittest
+from minipassword.search import FuzzyIndex
+
+
+class TestFuzzyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FuzzyIndex([
+            (1, 'Work mail', 'https://mail.example.com', None),
+            (2, 'Google Account', 'https://accounts.google.com', 'personal'),
+            (3, 'Bank', 'https://bank.example.com', 'gold card'),
+            (4, 'GitHub', 'https://github.com', 'go to settings'),
+        ])
+
+    def names(self, query):
+        return [row[1] for row in self.index.search(query)]
+
+    def test_word_prefix_ranks_first(self):
+        self.assertEqual(self.names('goo')[0], 'Google Account')
+
+    def test_fuzzy_subsequence(self):
+        self.assertEqual(self.names('ghb'), ['GitHub'])
+        self.assertEqual(self.names('xyz'), [])
+
+    def test_growing_and_shrinking_query(self):
+        self.assertEqual(len(self.names('g')), 3)
+        self.assertEqual(self.names('gold'), ['Bank'])
+        self.assertEqual(self.names('gol'), ['Bank', 'Google Account'])
+        self.assertEqual(self.names('go')[0], 'Google Account')
+        self.assertEqual(len(self.names('')), 4)
+
+    def test_ranks_every_entry(self):
+        # the best matches come last, after many weak ones
+        rows = [(i, f'o g l e {i}', f'https://example.com/{i}' + ('/google' if i % 10 == 0 else ''), None)
+                for i in range(5000)]
+        rows += [(5000, 'my google', None, None), (5001, 'Boogle', None, None)]
+        index = FuzzyIndex(rows)
+        self.assertEqual([row[1] for row in index.search('oogle', limit=2)], ['Boogle', 'my google'])
+        self.assertEqual([row[1] for row in index.search('oogl', limit=2)], ['Boogle', 'my google'])
+        self.assertEqual([row[0] for row in index.search('/4999')], [4999])
+        self.assertEqual([row[1] for row in index.search('my')], ['my google'])
+        # held by every entry, the best ranked, i.e. shortest, ones come first
+        self.assertEqual([row[1] for row in index.search('.com/', limit=2)], ['o g l e 1', 'o g l e 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import unittest
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from minipassword.secret import SecretBuffer, SecretCipher, write_secret
+from tests.vault import TempVault
+
+
+class TestSecretCipher(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = [Fernet.generate_key().decode(), Fernet.generate_key().decode()]
+        self.cipher = SecretCipher(self.keys)
+        self.fernet = MultiFernet([Fernet(key.encode()) for key in self.keys])
+
+    def test_fernet_compatible(self):
+        for value in ('', 'a', 'x' * 16, 'correct horse battery staple', 'pässwörd ✓' * 20):
+            with self.cipher.decrypt(Fernet(self.keys[1].encode()).encrypt(value.encode())) as secret:
+                self.assertEqual(secret.decode(), value)
+                self.assertEqual(secret, value)
+            self.assertEqual(self.fernet.decrypt(self.cipher.encrypt(value)).decode(), value)
+            self.assertEqual(Fernet(self.keys[0].encode()).decrypt(self.cipher.encrypt(value.encode())).decode(), value)
+
+    def test_invalid_tokens(self):
+        token = self.cipher.encrypt('secret')
+        other = SecretCipher([Fernet.generate_key().decode()])
+        for bad in ('not a token', token[:-4], token[:20] + ('A' if token[20] != 'A' else 'B') + token[21:], None):
+            with self.assertRaises(InvalidToken):
+                self.cipher.decrypt(bad)
+        with self.assertRaises(InvalidToken):
+            other.decrypt(token)
+
+    def test_wipe(self):
+        secret = self.cipher.decrypt(self.cipher.encrypt(SecretBuffer.from_str('hunter2')))
+        buffer = secret._buffer
+        self.assertEqual(bytes(secret.view), b'hunter2')
+        with secret:
+            pass
+        self.assertTrue(secret.wiped)
+        self.assertEqual(len(secret), 0)
+        self.assertEqual(buffer, bytearray(len(buffer)))
+        self.assertNotIn('hunter2', repr(secret))
+
+    def test_write_secret(self):
+        stream = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        stream.write('password: ')
+        with SecretBuffer.from_str('hunter2') as secret:
+            write_secret(stream, secret)
+        self.assertEqual(stream.buffer.getvalue(), b'password: hunter2')
+
+        stream = io.StringIO()
+        write_secret(stream, SecretBuffer.from_str('hunter2'))
+        self.assertEqual(stream.getvalue(), 'hunter2')
+
+
+class TestSecretEntries(unittest.TestCase):
+
+    def setUp(self):
+        self.vault = TempVault()
+        self.password_manager = self.vault.password_manager
+
+    def tearDown(self):
+        self.vault.cleanup()
+
+    def test_entry_secret(self):
+        self.password_manager.add_password('entry', SecretBuffer.from_str('me'), SecretBuffer.from_str('hunter2'))
+        entry = self.password_manager.get_password_by_name('entry')
+        with entry.secret() as password, entry.secret('login_name') as login_name:
+            self.assertEqual(password, 'hunter2')
+            self.assertEqual(login_name, 'me')
+        with self.assertRaises(ValueError):
+            entry.secret('memo')
+
+        # an update that keeps the password re-encrypts it from the buffer
+        with entry.secret() as password:
+            self.password_manager.update_password(entry.id, 'renamed', 'me', password)
+        self.assertEqual(self.password_manager.get_password_by_name('renamed').password, 'hunter2')
+
+    def test_rotated_keys(self):
+        self.vault.add_entries(3)
+        self.password_manager.rotate_key()
+        with self.password_manager.get_password_by_name('entry1').secret() as password:
+            self.assertEqual(password, 'secret1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from cryptography.fernet import Fernet
+from minipassword.box import ConfUtils, PasswordManager
+from minipassword.commands import CommandHandler, parse_args
+from minipassword.vaults import VaultSet
+
+
+class TestVaults(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.conf_utils = ConfUtils(data_path=f'{self.home.name}/.minipassword')
+        self.managers = {}
+        for name in ('default', 'staging', 'prod'):
+            vault_conf = ConfUtils(data_path=self.conf_utils.vault_path(name))
+            vault_conf.create_database_file()
+            vault_conf.set('common', 'aes_key', Fernet.generate_key().decode())
+            self.managers[name] = PasswordManager(conf_utils=vault_conf)
+        self.conf_utils.refresh()
+
+        self.managers['default'].add_password('github personal', 'me', 'secret-default')
+        self.managers['staging'].add_password('github staging', 'deploy', 'secret-staging')
+        self.managers['staging'].add_password('database staging', 'admin', 'db-staging')
+        self.managers['prod'].add_password('github', 'deploy', 'secret-prod')
+        self.managers['prod'].add_password('github actions', 'ci', 'secret-ci')
+
+    def tearDown(self):
+        for password_manager in self.managers.values():
+            password_manager.close()
+        self.home.cleanup()
+
+    def test_vault_names(self):
+        self.assertEqual(self.conf_utils.vault_names(), ['default', 'prod', 'staging'])
+        self.conf_utils.set('vaults', 'shared', f'{self.home.name}/shared')
+        self.assertEqual(self.conf_utils.vault_path('shared'), f'{self.home.name}/shared')
+        self.assertEqual(self.conf_utils.vault_names(), ['default', 'shared', 'prod', 'staging'])
+        with self.assertRaises(ValueError):
+            self.conf_utils.vault_path('../other')
+
+    def test_search_all_vaults(self):
+        with VaultSet(['default', 'staging', 'prod'], conf_utils=self.conf_utils) as vaults:
+            self.assertEqual(len(vaults), 3)
+            result = vaults.get_password('github')
+            # the best match of every vault first
+            self.assertEqual([(name, entry.name) for name, entry in result], [
+                ('default', 'github personal'), ('staging', 'github staging'), ('prod', 'github'),
+                ('prod', 'github actions'),
+            ])
+            self.assertEqual({name: entry.password for name, entry in result}['staging'], 'secret-staging')
+
+            self.assertEqual([name for name, _ in vaults.get_password('database')], ['staging'])
+            self.assertEqual([name for name, _ in vaults.get_password('deploy')], [])
+            # substring matches all score the same and keep the order of the vaults
+            self.assertEqual([name for name, _ in vaults.get_password('ithu')], ['default', 'staging', 'prod', 'prod'])
+
+            self.assertEqual([name for name, _ in vaults.get_password_by_name('github')], ['prod'])
+            self.assertEqual(vaults['staging'].get_password_by_name('database staging').password, 'db-staging')
+
+    def test_command_vault(self):
+        stdout = io.StringIO()
+        environ = {'HOME': self.home.name, 'MINIPASSWORD_AGENT_SOCK': os.path.join(self.home.name, 'none')}
+        with mock.patch.dict('os.environ', environ):
+            handler = CommandHandler(parse_args(['--vault', 'staging', 'get', 'github staging', '--field', 'login_name']))
+            with redirect_stdout(stdout):
+                handler.run()
+        handler.password_manager.close()
+        self.assertEqual(stdout.getvalue(), 'deploy\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import tempfile
+from cryptography.fernet import Fernet
+from minipassword.box import ConfUtils, PasswordManager
+
+
+class TempVault:
+    # a configured vault in a temporary directory, the user's own vault is never touched
+
+    def __init__(self, aes_key=None):
+        self.home = tempfile.TemporaryDirectory()
+        self.conf_utils = ConfUtils(data_path=f'{self.home.name}/.minipassword')
+        self.conf_utils.create_database_file()
+        self.conf_utils.set('common', 'aes_key', aes_key or Fernet.generate_key().decode())
+        self.password_manager = PasswordManager(conf_utils=self.conf_utils)
+
+    def add_entries(self, count, prefix='entry'):
+        self.password_manager.add_passwords(
+            {'name': f'{prefix}{i}', 'login_name': f'user{i}', 'password': f'secret{i}'} for i in range(count)
+        )
+
+    def cleanup(self):
+        self.password_manager.close()
+        self.home.cleanup()